@@ -0,0 +1,148 @@
+"""Micro-benchmark: cost of the play/play_next log lines on the calling thread, before and after.
+
+"before" is the old setup: f-string messages written synchronously by a FileHandler and a
+StreamHandler on the event loop. "after" is bot/logs.py: %-style messages put on a queue by
+LazyQueueHandler (high-frequency lines sampled per guild by GuildSampler) and written by a
+QueueListener thread through a RotatingFileHandler. --disk-latency adds a sleep to every file
+write to stand in for a slow or busy disk. The "after" runs also skip the record fields the
+formats do not use, as setup_logging() does. The stream handler writes to /dev/null.
+
+Usage: python -m benchmarks.bench_logging [--calls 100000] [--guilds 50] [--disk-latency 0]
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+
+from bot.logs import TEXT_FORMAT, GuildSampler, LazyQueueHandler, sampled, skip_unused_record_fields
+
+
+class Author:
+    # Formats like a discord.Member
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class SlowFileHandler(logging.handlers.RotatingFileHandler):
+    latency = 0.0
+
+    def emit(self, record):
+        if self.latency:
+            time.sleep(self.latency)
+        super().emit(record)
+
+
+def make_logger(name, *handlers):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+def before(logger, calls, guilds, authors):
+    for i in range(calls):
+        guild_id = i % guilds
+        author = authors[guild_id]
+        if i % 3 == 0:
+            logger.info(f"!play called by {author} in guild {guild_id} with query: song {i}")
+        elif i % 3 == 1:
+            logger.info(f"Queued: song {i} (requested by {author})")
+        else:
+            logger.info(f"Now playing: song {i} (requested by {author.name})")
+
+
+def after(logger, calls, guilds, authors):
+    for i in range(calls):
+        guild_id = i % guilds
+        author = authors[guild_id]
+        if i % 3 == 0:
+            logger.info("!play called by %s in guild %s with query: song %s", author, guild_id, i,
+                        extra=sampled(guild_id))
+        elif i % 3 == 1:
+            logger.info("Queued: song %s (requested by %s)", i, author, extra=sampled(guild_id))
+        else:
+            logger.info("Now playing: song %s (requested by %s)", i, author.name, extra=sampled(guild_id))
+
+
+def file_handlers(directory, formatter, devnull):
+    file_handler = SlowFileHandler(os.path.join(directory, "bench.log"), maxBytes=10 * 2 ** 20,
+                                   backupCount=2, encoding='utf-8')
+    stream_handler = logging.StreamHandler(devnull)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    return file_handler, stream_handler
+
+
+def run_before(args, directory, authors, devnull):
+    formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = file_handlers(directory, formatter, devnull)
+    logger = make_logger("bench.before", *handlers)
+    start = time.perf_counter()
+    before(logger, args.calls, args.guilds, authors)
+    elapsed = time.perf_counter() - start
+    for handler in handlers:
+        handler.close()
+    return elapsed, elapsed, args.calls
+
+
+def run_after(args, directory, authors, devnull, sample):
+    formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = file_handlers(directory, formatter, devnull)
+    records = queue.Queue(max(args.calls, 1))  # sized so nothing is dropped and all calls are comparable
+    queue_handler = LazyQueueHandler(records)
+    sampler = GuildSampler(burst=args.sample_burst if sample else 0)
+    queue_handler.addFilter(sampler)
+    logger = make_logger(f"bench.after.{sample}", queue_handler)
+    listener = logging.handlers.QueueListener(records, *handlers)
+    listener.start()
+    start = time.perf_counter()
+    after(logger, args.calls, args.guilds, authors)
+    elapsed = time.perf_counter() - start
+    listener.stop()  # waits for the writer thread to drain the queue
+    drained = time.perf_counter() - start
+    for handler in handlers:
+        handler.close()
+    written = args.calls - sum(window[2] for window in sampler.windows.values())
+    return elapsed, drained, written
+
+
+def report(label, args, elapsed, drained, written):
+    print(f"  {label:28} {elapsed / args.calls * 1e6:7.2f} us/call on the caller  "
+          f"{written:7d} lines written, all on disk after {drained:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--disk-latency', type=float, default=0.0, help="seconds added to every file write")
+    parser.add_argument('--sample-burst', type=int, default=5, help="sampled records per guild and event per 10s")
+    args = parser.parse_args()
+
+    SlowFileHandler.latency = args.disk_latency
+    authors = [Author(f"user{g}#0001") for g in range(args.guilds)]
+    disabled = make_logger("bench.disabled", logging.NullHandler())
+    disabled.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="octavia-bench-logs-", ignore_cleanup_errors=True) as directory:
+        with open(os.devnull, "w") as devnull:
+            print(f"{args.calls} log calls from {args.guilds} guilds, disk latency {args.disk_latency * 1000:.1f} ms/write")
+            start = time.perf_counter()
+            after(disabled, args.calls, args.guilds, authors)
+            floor = time.perf_counter() - start
+            print(f"  {'level disabled':28} {floor / args.calls * 1e6:7.2f} us/call on the caller")
+            report("sync handlers (before)", args, *run_before(args, directory, authors, devnull))
+            skip_unused_record_fields()  # as setup_logging() does
+            report("queue, no sampling", args, *run_after(args, directory, authors, devnull, False))
+            report("queue + sampling (after)", args, *run_after(args, directory, authors, devnull, True))
+
+
+if __name__ == "__main__":
+    main()
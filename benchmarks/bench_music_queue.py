@@ -0,0 +1,151 @@
+"""Micro-benchmark: legacy list-of-tuples MusicQueue vs the indexed GuildQueue engine.
+
+The indexed queue also times its first search in a guild (which builds that guild's search
+index) and a repeat search, and checks that a track queued from a YouTube watch URL is found by
+searching for the same URL.
+
+Usage: python -m benchmarks.bench_music_queue [--tracks 10000] [--guilds 1000]
+"""
+import argparse
+import gc
+import time
+
+from bot.music_queue import MusicQueue
+
+
+class LegacyMusicQueue:
+    # Verbatim copy of the pre-rewrite queue (bot/music_queue.py at the baseline commit), kept
+    # here only for comparison. Only the class name differs.
+    def __init__(self):
+        # Each entry: (url, title, ctx, duration, requester, search_query) where url/title/duration may be None for pending
+        self.queues = {}  # guild_id: list
+        self.now_playing = {}  # guild_id: (url, title, ctx, duration, requester, search_query)
+
+    def add(self, guild_id, url_or_query, title, ctx, duration, requester, pending=False):
+        if guild_id not in self.queues:
+            self.queues[guild_id] = []
+        if pending:
+            self.queues[guild_id].append((None, None, ctx, None, requester, url_or_query))
+        else:
+            self.queues[guild_id].append((url_or_query, title, ctx, duration, requester, url_or_query))
+
+    def next(self, guild_id):
+        if guild_id in self.queues and self.queues[guild_id]:
+            next_track = self.queues[guild_id].pop(0)
+            self.now_playing[guild_id] = next_track
+            return next_track
+        else:
+            self.now_playing[guild_id] = None
+            return None
+
+    def set_now_playing(self, guild_id, url, title, ctx, duration, requester, search_query=None):
+        self.now_playing[guild_id] = (url, title, ctx, duration, requester, search_query or url)
+
+    def clear(self, guild_id):
+        self.queues[guild_id] = []
+        self.now_playing[guild_id] = None
+
+    def is_empty(self):
+        return all(not q for q in self.queues.values())
+
+    def get_queue(self, guild_id):
+        return self.queues.get(guild_id, [])
+
+    def get_now_playing(self, guild_id):
+        return self.now_playing.get(guild_id)
+
+    def mark_resolved(self, guild_id, idx, url, title, duration):
+        q = self.queues[guild_id]
+        _, _, ctx, _, requester, search_query = q[idx]
+        q[idx] = (url, title, ctx, duration, requester, search_query)
+
+    def next_pending(self, guild_id):
+        q = self.queues.get(guild_id, [])
+        for idx, (url, title, ctx, duration, requester, search_query) in enumerate(q):
+            if title is None:
+                return idx, search_query, ctx, requester
+        return None 
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(queue_cls, tracks, guilds, ops, drain_guilds):
+    q = queue_cls()
+    results = {}
+
+    def fill():
+        for g in range(guilds):
+            for i in range(tracks):
+                # Resolved head, pending tail: the shape of a Spotify playlist being resolved.
+                if i < tracks // 2:
+                    q.add(g, f"https://example/{g}/{i}", f"Song {i}", None, 180, "user")
+                else:
+                    q.add(g, f"song {i} artist", None, None, None, "user", pending=True)
+
+    results['fill'] = timed(fill)
+
+    def is_empty():
+        # The bot's "anything queued anywhere?" check; the baseline queue has no per-guild variant
+        for _ in range(ops):
+            q.is_empty()
+
+    results['is_empty x%d' % ops] = timed(is_empty)
+
+    def resolve():
+        for _ in range(ops):
+            pending = q.next_pending(0)
+            if pending is None:
+                break
+            q.mark_resolved(0, pending[0], "https://example/resolved", "Resolved", 200)
+
+    results['next_pending+mark_resolved x%d' % ops] = timed(resolve)
+
+    def drain():
+        for g in range(1, 1 + drain_guilds):
+            while q.next(g % guilds) is not None:
+                pass
+
+    results['drain %d guild(s)' % drain_guilds] = timed(drain)
+
+    if hasattr(q, 'search'):
+        results['first search (builds the index)'] = timed(lambda: q.search(0, "artist"))
+        results['repeat search x%d' % ops] = timed(lambda: [q.search(0, f"song {i} artist") for i in range(ops)])
+    del q
+    gc.collect()
+    return results
+
+
+def check_search():
+    q = MusicQueue()
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42"
+    q.add(1, "https://example/stream", "Some Song", None, 180, "user", search_query=url)
+    q.add(1, "https://www.youtube.com/watch?v=aaaaaaaaaaa", "Other Song", None, 180, "user")
+    assert q.search(1, url) == [0], q.search(1, url)
+    assert q.search(1, "https://youtu.be/dQw4w9WgXcQ") == [0]
+    assert q.search(1, "youtube.com/watch") == []
+    q.add(1, "https://www.youtube.com/watch?v=bbbbbbbbbbb", "Third Song", None, 180, "user")
+    assert q.search(1, "https://www.youtube.com/watch?v=bbbbbbbbbbb") == [2]  # added after the index was built
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=10000, help="tracks per guild")
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--ops', type=int, default=1000, help="is_empty/next_pending calls to time")
+    parser.add_argument('--drain-guilds', type=int, default=3, help="guild queues to drain with next()")
+    args = parser.parse_args()
+
+    check_search()
+    print(f"{args.tracks} tracks x {args.guilds} guilds")
+    for name, cls in (("legacy", LegacyMusicQueue), ("indexed", MusicQueue)):
+        results = run(cls, args.tracks, args.guilds, args.ops, args.drain_guilds)
+        for label, seconds in results.items():
+            print(f"  {name:8} {label:40} {seconds * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""CPU cost per concurrent stream: PCM transcode + in-process Opus encode vs Opus passthrough.
+
+Needs ffmpeg on PATH and libopus loadable by discord.py. SOURCE is a local file or stream URL,
+ideally Opus/WebM (e.g. `yt-dlp -f 251 -o sample.webm <url>`).
+
+Usage: python -m benchmarks.bench_playback_cpu SOURCE [--streams 8] [--seconds 30]
+"""
+import argparse
+import resource
+import threading
+import time
+
+import discord
+
+from bot.audio import FFMPEG_BEFORE_OPTIONS
+
+FRAMES_PER_SECOND = 50  # discord sends 20 ms frames
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def pcm_stream(source, frames, before_options):
+    # What the bot did before: ffmpeg decodes to PCM, discord.py encodes every frame to Opus
+    audio = discord.FFmpegPCMAudio(source, before_options=before_options)
+    encoder = discord.opus.Encoder()
+    try:
+        for _ in range(frames):
+            data = audio.read()
+            if not data:
+                break
+            encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+    finally:
+        audio.cleanup()
+
+
+def opus_stream(source, frames, before_options):
+    # Passthrough: ffmpeg remuxes Opus packets, discord.py sends them as-is
+    audio = discord.FFmpegOpusAudio(source, codec='copy', before_options=before_options)
+    try:
+        for _ in range(frames):
+            if not audio.read():
+                break
+    finally:
+        audio.cleanup()
+
+
+def run(fn, source, streams, frames, before_options):
+    threads = [threading.Thread(target=fn, args=(source, frames, before_options)) for _ in range(streams)]
+    cpu_before = cpu_seconds()
+    wall_before = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return cpu_seconds() - cpu_before, time.perf_counter() - wall_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source')
+    parser.add_argument('--streams', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=30, help="audio seconds read per stream")
+    args = parser.parse_args()
+
+    if not discord.opus.is_loaded():
+        discord.opus._load_default()
+    before_options = FFMPEG_BEFORE_OPTIONS if "://" in args.source else None
+    frames = args.seconds * FRAMES_PER_SECOND
+    print(f"{args.streams} concurrent streams x {args.seconds}s of audio")
+    for name, fn in (("pcm", pcm_stream), ("opus", opus_stream)):
+        cpu, wall = run(fn, args.source, args.streams, frames, before_options)
+        per_stream = cpu / args.streams
+        print(f"  {name:5} cpu {cpu:7.2f}s  wall {wall:6.2f}s  "
+              f"{per_stream:6.3f} cpu-s/stream  ({per_stream / args.seconds * 100:5.2f}% of a core per stream)")
+
+
+if __name__ == "__main__":
+    main()
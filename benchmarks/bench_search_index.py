@@ -0,0 +1,77 @@
+"""Micro-benchmark: per-command linear queue scans vs the trigram SearchIndex.
+
+Usage: python -m benchmarks.bench_search_index [--tracks 5000] [--lookups 1000]
+"""
+import argparse
+import random
+import time
+
+from bot.music_queue import MusicQueue
+
+WORDS = ("love", "night", "dance", "summer", "heart", "fire", "blue", "dream", "city", "light",
+         "rain", "gold", "shadow", "river", "ocean", "star", "wild", "electric", "lonely", "forever")
+
+
+def linear_search(tracks, query):
+    # The scan !play and !requestinfo used to run on every call
+    for idx, (url, title, ctx_obj, duration, requester, search_query) in enumerate(tracks):
+        match_title = (title and query.lower() in title.lower())
+        match_url = (url and query.lower() in url.lower())
+        match_search = (search_query and query.lower() in search_query.lower())
+        if match_title or match_url or match_search:
+            return idx
+    return None
+
+
+def build_queue(n, rng):
+    q = MusicQueue()
+    for i in range(n):
+        name = " ".join(rng.choice(WORDS) for _ in range(3))
+        if i % 3 == 0:
+            q.add(0, f"{name} artist{i}", None, None, None, "user", pending=True)
+        else:
+            q.add(0, f"https://rr1---sn-abc.googlevideo.com/videoplayback?id={i}&expire=1700000000",
+                  f"{name.title()} (Official Video) {i}", None, 200, "user")
+    return q
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    q = build_queue(args.tracks, rng)
+    print(f"built {args.tracks}-track queue in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    tracks = q.get_queue(0)
+    queries = []
+    for _ in range(args.lookups):
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(f"official video) {rng.randrange(args.tracks)}")  # late hit
+        elif kind < 0.8:
+            queries.append(f"never gonna give {rng.randrange(10**6)}")  # miss: full scan before
+        else:
+            queries.append(" ".join(rng.choice(WORDS) for _ in range(2)))  # early hit
+
+    # The index is built lazily by the first search; time that on its own
+    start = time.perf_counter()
+    q.search(0, queries[0])
+    print(f"  first search (builds the index) {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for name, fn in (("linear", lambda query: linear_search(tracks, query)),
+                     ("indexed", lambda query: (q.search(0, query) or [None])[0])):
+        start = time.perf_counter()
+        for query in queries:
+            fn(query)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:8} {args.lookups} lookups {elapsed * 1000:10.2f} ms "
+              f"({elapsed / args.lookups * 1e6:.1f} us/lookup)")
+
+
+if __name__ == "__main__":
+    main()
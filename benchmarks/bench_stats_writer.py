@@ -0,0 +1,68 @@
+"""Event-loop stall caused by playback-stats writes: per-insert connections vs the batched StatsWriter.
+
+Runs against a throwaway database in a temporary directory.
+
+Usage: python -m benchmarks.bench_stats_writer [--records 500] [--interval 0.005]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import bot.database as db
+
+
+async def lag_monitor(samples, tick=0.001):
+    # Records how late each tick wakes up: time the loop spent blocked
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(tick)
+        samples.append(time.perf_counter() - start - tick)
+
+
+async def drive(records, interval, record):
+    samples = []
+    monitor = asyncio.create_task(lag_monitor(samples))
+    await asyncio.sleep(0.05)
+    blocked = 0.0
+    for i in range(records):
+        start = time.perf_counter()
+        record(f"user{i % 50}", f"Song {i % 200}", f"https://example/{i}", 200, str(i % 20), f"Guild {i % 20}")
+        blocked += time.perf_counter() - start
+        await asyncio.sleep(interval)  # track starts arriving over time
+    monitor.cancel()
+    return blocked, samples
+
+
+def report(name, blocked, samples, records):
+    samples.sort()
+    p99 = samples[int(0.99 * (len(samples) - 1))] if samples else 0
+    print(f"  {name:9} in-loop write time {blocked * 1000:9.2f} ms total, {blocked / records * 1e6:8.1f} us/record; "
+          f"loop lag p99 {p99 * 1000:6.2f} ms, max {max(samples, default=0) * 1000:6.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=0.005, help="seconds between track starts")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="octavia-bench-", ignore_cleanup_errors=True) as workdir:
+        db.DB_PATH = os.path.join(workdir, "musicbot.db")
+        db.init_db()
+        print(f"{args.records} playback records, one every {args.interval * 1000:.0f} ms")
+
+        blocked, samples = await drive(args.records, args.interval, db.insert_playback)
+        report("per-insert", blocked, samples, args.records)
+
+        writer = db.StatsWriter()
+        writer.start()
+        blocked, samples = await drive(args.records, args.interval, writer.record)
+        await writer.close()
+        report("batched", blocked, samples, args.records)
+        print(f"  batched wrote {writer.written} records in {writer.batches} batches")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
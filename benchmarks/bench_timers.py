@@ -0,0 +1,85 @@
+"""Micro-benchmark: idle-disconnect timers as one sleeping asyncio task per guild vs the TimerHeap.
+
+Every guild arms its timer when its queue ends and cancels it when the next song starts, --cycles
+times; then every guild's timer is left armed and memory is measured with tracemalloc.
+
+Usage: python -m benchmarks.bench_timers [--guilds 10000] [--cycles 20]
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from bot.timers import TimerHeap
+
+
+async def idle(guild_id):
+    await asyncio.sleep(300)
+
+
+async def with_tasks(guilds, cycles):
+    timers = {}
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for g in range(guilds):
+            if g in timers:
+                timers[g].cancel()
+            timers[g] = asyncio.create_task(idle(g))
+        await asyncio.sleep(0)  # let the tasks start (and the cancelled ones finish)
+    elapsed = time.perf_counter() - start
+    return elapsed, timers
+
+
+async def with_heap(guilds, cycles):
+    timers = TimerHeap()
+    timers.start()
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for g in range(guilds):
+            timers.schedule(('disconnect', g), 300, idle, g)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    return elapsed, timers
+
+
+async def release(state):
+    if isinstance(state, TimerHeap):
+        await state.close()
+    else:
+        for task in state.values():
+            task.cancel()
+        await asyncio.sleep(0)
+
+
+async def measure(fn, guilds, cycles):
+    # Timed without tracemalloc, which slows every allocation down
+    elapsed, state = await fn(guilds, cycles)
+    await release(state)
+    gc.collect()
+    tracemalloc.start()
+    _, state = await fn(guilds, 1)
+    await asyncio.sleep(0)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await release(state)
+    return elapsed, current
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=10000)
+    parser.add_argument('--cycles', type=int, default=20)
+    args = parser.parse_args()
+
+    ops = args.guilds * args.cycles
+    print(f"{args.guilds} guilds x {args.cycles} arm/cancel cycles")
+    for label, fn in (("task per guild", with_tasks), ("timer heap", with_heap)):
+        elapsed, memory = await measure(fn, args.guilds, args.cycles)
+        print(f"  {label:16} {elapsed * 1000:8.1f} ms  {elapsed / ops * 1e6:6.2f} us/op  "
+              f"{memory / 2 ** 20:6.2f} MB with every timer armed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""Memory benchmark: queued tracks holding their command Context vs compact ID-only tracks.
+
+Builds the same multi-guild workload (--tracks spread over --guilds, part queued by single
+!play commands, the rest by playlists) twice in GuildQueues: once with the old Track that keeps
+the command ctx (and with it the message, its content and parsing state), once with the current
+Track that keeps channel/author IDs. Memory is measured with tracemalloc. Contexts are real
+discord.py Context objects around a stand-in Message with the same attributes as discord.Message;
+guilds, channels and members are shared by both runs, as they live in discord.py's cache anyway.
+
+Usage: python -m benchmarks.bench_track_memory [--tracks 50000] [--guilds 100] [--single-share 0.3]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+import discord
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+
+from bot.music_queue import GuildQueue, Track, origin_ids
+
+
+class LegacyTrack(Track):
+    # The previous record, which kept the command context for as long as the track was queued
+    __slots__ = ('ctx',)
+
+    def __init__(self, url, title, ctx, duration, requester, search_query, pending=False, video_id=None):
+        super().__init__(url, title, None, duration, requester, search_query, pending, video_id)
+        self.ctx = ctx
+
+
+MESSAGE_SLOTS = sorted({name for cls in discord.Message.__mro__ for name in getattr(cls, '__slots__', ())
+                        if name != '__weakref__'})
+
+
+class FakeMessage:
+    # Same attributes as discord.Message, filled the way a plain text command fills them
+    __slots__ = tuple(MESSAGE_SLOTS)
+
+    def __init__(self, i, content, channel, author, guild):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.id = 10 ** 17 + i
+        self.content = content
+        self.channel = channel
+        self.author = author
+        self.guild = guild
+        self.attachments = []
+        self.embeds = []
+        self.mentions = []
+        self.role_mentions = []
+        self.components = []
+        self.reactions = []
+        self.stickers = []
+        self.flags = discord.MessageFlags()
+        self.type = discord.MessageType.default
+
+
+class Shared:
+    # Stand-ins for objects discord.py caches once per guild (not per command)
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.channel = type('Channel', (), {'id': guild_id + 1, 'guild': self})()
+        self.members = [type('Member', (), {'id': guild_id + 100 + m, 'display_name': f"user{m}"})() for m in range(20)]
+
+
+def make_ctx(bot, shared, i, query):
+    author = random.choice(shared.members)
+    content = f"!play {query}"
+    message = FakeMessage(i, content, shared.channel, author, shared)
+    view = StringView(content)
+    view.skip_string("!")
+    view.get_word()
+    view.skip_ws()
+    return commands.Context(message=message, bot=bot, view=view, args=[None], kwargs={'query': query},
+                            prefix="!", invoked_with="play")
+
+
+def workload(guilds, tracks, single_share, playlist_size):
+    # [(guild_index, [queries...])]: one entry per command
+    commands_ = []
+    per_guild = tracks // guilds
+    for g in range(guilds):
+        left = per_guild
+        while left > 0:
+            if random.random() < single_share:
+                n = 1
+            else:
+                n = min(left, playlist_size)
+            commands_.append((g, [f"guild {g} song {left - k} artist {k % 13}" for k in range(n)]))
+            left -= n
+    return commands_
+
+
+def build(commands_, bot, shareds, legacy):
+    queues = {}
+    for i, (g, queries) in enumerate(commands_):
+        ctx = make_ctx(bot, shareds[g], i, queries[0] if len(queries) == 1 else f"https://www.youtube.com/playlist?list=PL{i}")
+        requester = ctx.author.display_name
+        if legacy:
+            tracks = [LegacyTrack(None, None, ctx, 180, requester, q, pending=True) for q in queries]
+        else:
+            channel_id, author_id = origin_ids(ctx)
+            tracks = [Track(None, None, channel_id, 180, requester, q, pending=True, author_id=author_id) for q in queries]
+        queue = queues.get(g)
+        if queue is None:
+            queue = queues[g] = GuildQueue()
+        queue.extend(tracks)
+    return queues
+
+
+def measure(commands_, bot, shareds, legacy):
+    gc.collect()
+    tracemalloc.start()
+    queues = build(commands_, bot, shareds, legacy)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = sum(len(q) for q in queues.values())
+    del queues
+    gc.collect()
+    return current, peak, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=50000)
+    parser.add_argument('--guilds', type=int, default=100)
+    parser.add_argument('--single-share', type=float, default=0.3, help="chance that a command is a single !play")
+    parser.add_argument('--playlist-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    commands_ = workload(args.guilds, args.tracks, args.single_share, args.playlist_size)
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+    shareds = [Shared((g + 1) << 22) for g in range(args.guilds)]
+
+    print(f"{args.tracks} tracks in {args.guilds} guilds from {len(commands_)} commands")
+    results = {}
+    for label, legacy in (("ctx per track (before)", True), ("IDs per track (after)", False)):
+        current, peak, total = measure(commands_, bot, shareds, legacy)
+        results[label] = current
+        print(f"  {label:24} {current / 2 ** 20:8.2f} MB retained  {current / total:7.0f} B/track  "
+              f"(peak {peak / 2 ** 20:.2f} MB)")
+    before, after = results.values()
+    print(f"  saved {(before - after) / 2 ** 20:.2f} MB ({(before - after) / before * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Concurrent load test for the dashboard's analytics endpoints: latency percentiles under contention.
+
+Without --url, starts the dashboard with uvicorn on a throwaway database seeded with --rows playback
+records, and keeps a StatsWriter inserting into it for the duration of the run so reads compete
+with writes. With --url, loads an already running dashboard instead.
+
+Usage: python -m benchmarks.load_dashboard [--requests 2000] [--concurrency 50] [--rows 100000] [--url http://127.0.0.1:8000]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+import bot.database as db
+
+PATHS = ["/", "/analytics/songs", "/analytics/servers", "/analytics/users", "/analytics/hourly", "/dashboard"]
+
+
+def seed(rows):
+    db.init_db()
+    writer = db.StatsWriter()
+    writer.buffer = [(f"user{i % 500}", f"Song {i % 5000}", f"https://example/{i}", 200, str(i % 100), f"Guild {i % 100}",
+                      time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - i * 30))) for i in range(rows)]
+    writer.flush_sync()
+
+
+async def write_load(stop, interval=0.01):
+    writer = db.StatsWriter(batch_size=50, flush_interval=0.2)
+    writer.start()
+    i = 0
+    while not stop.is_set():
+        writer.record(f"user{i % 500}", f"Song {i % 5000}", f"https://example/w{i}", 200, str(i % 100), f"Guild {i % 100}")
+        i += 1
+        await asyncio.sleep(interval)
+    await writer.close()
+    return writer.written
+
+
+async def wait_ready(session, url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url + "/analytics/songs") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"dashboard at {url} did not come up")
+
+
+async def load(session, url, requests, concurrency):
+    latencies = {path: [] for path in PATHS}
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            path = PATHS[i % len(PATHS)]
+            start = time.perf_counter()
+            try:
+                async with session.get(url + path) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies[path].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(samples, q):
+    return samples[int(q * (len(samples) - 1))] if samples else 0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=100000, help="playback records to seed (local server only)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help="load an already running dashboard instead of starting one")
+    args = parser.parse_args()
+
+    server = None
+    stop = asyncio.Event()
+    writes = None
+    url = args.url
+    workdir = None
+    if url is None:
+        workdir = tempfile.TemporaryDirectory(prefix="octavia-bench-", ignore_cleanup_errors=True)
+        db.DB_PATH = os.path.join(workdir.name, "musicbot.db")
+        seed(args.rows)
+        env = dict(os.environ, MUSICBOT_DB=db.DB_PATH)
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "dashboard.app:app", "--port", str(args.port),
+                                   "--log-level", "warning"], env=env)
+        url = f"http://127.0.0.1:{args.port}"
+    url = url.rstrip("/")
+
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as session:
+            await wait_ready(session, url)
+            if server is not None:
+                writes = asyncio.create_task(write_load(stop))
+            latencies, errors, elapsed = await load(session, url, args.requests, args.concurrency)
+    finally:
+        stop.set()
+        written = await writes if writes is not None else 0
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if workdir is not None:
+            workdir.cleanup()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.0f} req/s, {errors} errors"
+          + (f", {written} concurrent inserts" if server is not None else ""))
+    everything = []
+    for path, samples in latencies.items():
+        samples.sort()
+        everything += samples
+        print(f"  {path:20} p50 {percentile(samples, 0.5) * 1000:7.2f} ms  p99 {percentile(samples, 0.99) * 1000:7.2f} ms  "
+              f"max {max(samples, default=0) * 1000:7.2f} ms")
+    everything.sort()
+    print(f"  {'all':20} p50 {percentile(everything, 0.5) * 1000:7.2f} ms  p99 {percentile(everything, 0.99) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,523 @@
+"""Offline load test of the Music cog: N guilds x M tracks against fake Discord, yt-dlp and Spotify.
+
+Every guild connects and, concurrently with the others, queues --tracks searches (a --overlap
+share of them popular songs other guilds request too), a YouTube playlist and a Spotify playlist,
+then runs !queue, !requestinfo and !shuffle and plays its queue to the end. The fakes have
+configurable latency and failure rates; nothing touches the network or Discord. Tracks play in
+compressed time (--track-seconds each): when a fake track ends, its recorded start is moved back
+so the cog sees a full-length play, unless the track was picked to stop early (--early-stop-rate),
+which exercises the retry path.
+
+Reports command throughput, p50/p99 latency per command, how long queued playlist tracks waited
+to be resolved, the gap between tracks, event-loop lag and memory. --json writes the results to a file; --baseline compares against an earlier one.
+
+Usage: python -m benchmarks.load_music [--guilds 50] [--tracks 10] [--extract-latency 0.05] [--json results.json]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+import yt_dlp
+from yt_dlp.utils import DownloadError
+
+import bot.database as db
+import bot.music as music
+import bot.spotify as spotify_module
+
+
+class FakeYoutubeDL:
+    # Stands in for yt_dlp.YoutubeDL inside the extractor pool's worker threads
+    latency = 0.05
+    jitter = 0.5
+    failure_rate = 0.0
+    playlist_size = 20
+
+    def __init__(self, opts=None):
+        self.opts = opts or {}
+
+    def _sleep(self):
+        time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def extract_info(self, query, download=False):
+        self._sleep()
+        if random.random() < self.failure_rate:
+            raise DownloadError(f"fake extraction failure for {query}")
+        if "list=" in query:
+            playlist_id = query.split("list=", 1)[1]
+            return {
+                'title': f"Playlist {playlist_id}",
+                'entries': [{'id': fake_video_id(f"{playlist_id}/{i}"),
+                             'url': f"https://www.youtube.com/watch?v={fake_video_id(f'{playlist_id}/{i}')}",
+                             'title': f"{playlist_id} track {i}", 'duration': 180}
+                            for i in range(self.playlist_size)],
+            }
+        if "watch?v=" in query:
+            video_id = query.split("watch?v=", 1)[1][:11]
+        else:
+            video_id = fake_video_id(query)
+        return {
+            'extractor_key': 'Youtube',
+            'id': video_id,
+            'url': f"https://fake-stream.invalid/{video_id}?expire={int(time.time()) + 6 * 3600}",
+            'title': f"Title of {video_id}",
+            'duration': 180,
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+        }
+
+    def sanitize_info(self, info):
+        return info
+
+
+def fake_video_id(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:11]
+
+
+class FakeSpotify:
+    # Stands in for spotipy.Spotify: playlists and albums of `playlist_size` tracks
+    latency = 0.1
+    failure_rate = 0.0
+    playlist_size = 20
+
+    def __init__(self, auth_manager=None):
+        pass
+
+    def _call(self):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("fake Spotify failure")
+
+    def _item(self, collection_id, i):
+        return {'id': f"{collection_id}{i:04d}", 'name': f"{collection_id} song {i}", 'duration_ms': 180000,
+                'artists': [{'name': f"Artist {i % 7}"}], 'external_ids': {'isrc': f"FAKE{collection_id}{i:04d}"}}
+
+    def _page(self, collection_id, offset, limit, wrap):
+        items = [self._item(collection_id, i) for i in range(offset, min(offset + limit, self.playlist_size))]
+        return {'items': [{'track': item} for item in items] if wrap else items, 'limit': limit,
+                'total': self.playlist_size}
+
+    def playlist(self, playlist_id, fields=None):
+        self._call()
+        return {'name': f"Spotify playlist {playlist_id}", 'tracks': self._page(playlist_id, 0, 100, True)}
+
+    def playlist_items(self, playlist_id, limit=100, offset=0, fields=None):
+        self._call()
+        return self._page(playlist_id, offset, limit, True)
+
+    def album(self, album_id):
+        self._call()
+        return {'name': f"Spotify album {album_id}", 'tracks': self._page(album_id, 0, 50, False)}
+
+    def album_tracks(self, album_id, limit=50, offset=0):
+        self._call()
+        return self._page(album_id, offset, limit, False)
+
+    def track(self, track_id):
+        self._call()
+        return self._item(track_id, 0)
+
+
+class FakeSource:
+    def cleanup(self):
+        pass
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.cog = None
+        self.loop = None
+        self.command_latencies = {}  # command: [seconds]
+        self.gaps = []
+        self.plays = 0
+        self.early_stops = 0
+        self.messages = 0
+        self.loop_lag = []
+        self.pending_since = {}  # Track: when it was queued unresolved
+        self.pending_waits = []  # seconds from being queued to getting a stream URL
+
+    def watch_pending(self, queue):
+        # Time every pending track from add_many() to the resolve_track() that gives it a URL,
+        # whichever of the resolver, the prefetcher or play_next gets there first
+        add_many, resolve_track = queue.add_many, queue.resolve_track
+
+        def timed_add_many(*args, **kwargs):
+            tracks = add_many(*args, **kwargs)
+            now = time.perf_counter()
+            for track in tracks:
+                self.pending_since[track] = now
+            return tracks
+
+        def timed_resolve_track(guild_id, track, url, *args, **kwargs):
+            queued = self.pending_since.pop(track, None) if url else None
+            if queued is not None:
+                self.pending_waits.append(time.perf_counter() - queued)
+            return resolve_track(guild_id, track, url, *args, **kwargs)
+
+        queue.add_many, queue.resolve_track = timed_add_many, timed_resolve_track
+
+    def timed(self, name, coro):
+        async def run():
+            start = time.perf_counter()
+            try:
+                await coro
+            finally:
+                self.command_latencies.setdefault(name, []).append(time.perf_counter() - start)
+        return run()
+
+    async def sample_loop_lag(self, interval=0.05):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, time.perf_counter() - start - interval))
+
+
+class FakeVoiceClient:
+    def __init__(self, harness, guild, channel):
+        self.harness = harness
+        self.guild = guild
+        self.channel = channel
+        self.source = None
+        self.paused = False
+        self._end = None
+        self._after = None
+        self.ended_at = None
+
+    def is_playing(self):
+        return self.source is not None and not self.paused
+
+    def is_paused(self):
+        return self.source is not None and self.paused
+
+    def play(self, source, after=None):
+        harness = self.harness
+        if self.ended_at is not None:
+            harness.gaps.append(time.perf_counter() - self.ended_at)
+            self.ended_at = None
+        harness.plays += 1
+        self.source, self._after = source, after
+        early = random.random() < harness.args.early_stop_rate
+        self._end = harness.loop.call_later(harness.args.track_seconds, self._finish, early)
+
+    def _finish(self, early=False):
+        if self.source is None:
+            return
+        if early:
+            self.harness.early_stops += 1
+        else:
+            # Compressed time: make the cog see the whole track as played
+            entry = self.harness.cog.song_start_times.get(self.guild.id)
+            if entry is not None:
+                self.harness.cog.song_start_times[self.guild.id] = (entry[0] - 3600,) + entry[1:]
+        self.source = None
+        self.ended_at = time.perf_counter()
+        if self._after is not None:
+            self._after(None)
+
+    def stop(self):
+        if self._end is not None:
+            self._end.cancel()
+        self._finish()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    async def disconnect(self, force=False):
+        if self._end is not None:
+            self._end.cancel()
+        self.source = None
+        self.guild.voice_client = None
+        if self in self.harness.bot.voice_clients:
+            self.harness.bot.voice_clients.remove(self)
+
+
+class FakeChannel:
+    def __init__(self, harness, guild, channel_id):
+        self.harness = harness
+        self.guild = guild
+        self.id = channel_id
+        self.members = []
+
+    async def send(self, *args, **kwargs):
+        self.harness.messages += 1
+        if self.harness.args.send_latency:
+            await asyncio.sleep(self.harness.args.send_latency)
+
+    async def connect(self, self_mute=False, self_deaf=False):
+        vc = FakeVoiceClient(self.harness, self.guild, self)
+        self.guild.voice_client = vc
+        self.harness.bot.voice_clients.append(vc)
+        return vc
+
+
+class FakeGuild:
+    def __init__(self, harness, index):
+        self.id = (index + 1) << 22  # snowflake-like, spread over shards
+        self.name = f"Guild {index}"
+        self.voice_client = None
+        self.text = FakeChannel(harness, self, self.id + 1)
+        self.voice = FakeChannel(harness, self, self.id + 2)
+
+    def get_channel(self, channel_id):
+        return {self.text.id: self.text, self.voice.id: self.voice}.get(channel_id)
+
+    get_channel_or_thread = get_channel
+
+    def get_member(self, member_id):
+        return None
+
+
+class FakeAuthor:
+    bot = False
+
+    def __init__(self, guild, index):
+        self.id = guild.id + 100 + index
+        self.display_name = f"user{index}"
+        self.voice = type('VoiceState', (), {'channel': guild.voice})()
+
+    def __str__(self):
+        return self.display_name
+
+
+class FakeContext:
+    def __init__(self, bot, guild, author):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        await self.channel.send(*args, **kwargs)
+
+
+class FakeBot:
+    shard_count = None
+    shard_ids = None
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.voice_clients = []
+        self.guilds = {}
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+
+async def guild_session(harness, guild, index):
+    cog, args = harness.cog, harness.args
+    ctx = FakeContext(harness.bot, guild, FakeAuthor(guild, 0))
+    queries = []
+    for i in range(args.tracks):
+        if random.random() < args.overlap:
+            queries.append(f"popular song {random.randrange(args.popular)}")
+        else:
+            queries.append(f"guild {index} song {i}")
+    for query in queries:
+        await harness.timed('play', cog.play.callback(cog, ctx, query=query))
+    await harness.timed('play_playlist', cog.play.callback(cog, ctx, query=f"https://www.youtube.com/playlist?list=PL{index:06d}"))
+    await harness.timed('play_spotify', cog.play.callback(cog, ctx, query=f"https://open.spotify.com/playlist/sp{index:06d}"))
+    await harness.timed('queue', cog.queue_.callback(cog, ctx, 1))
+    await harness.timed('requestinfo', cog.requestinfo.callback(cog, ctx, query=queries[-1]))
+    await harness.timed('shuffle', cog.shuffle.callback(cog, ctx))
+
+
+async def wait_drained(harness, timeout):
+    # Until every guild has played its whole queue
+    deadline = time.monotonic() + timeout
+    cog = harness.cog
+    while time.monotonic() < deadline:
+        if all(not cog.queue.get_queue(guild_id) and (guild.voice_client is None or not guild.voice_client.is_playing())
+               for guild_id, guild in harness.bot.guilds.items()):
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[int(q * (len(samples) - 1))] if samples else 0
+
+
+def summary(samples):
+    return {'count': len(samples), 'p50_ms': percentile(samples, 0.5) * 1000, 'p99_ms': percentile(samples, 0.99) * 1000,
+            'max_ms': max(samples, default=0) * 1000}
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run(args, workdir):
+    random.seed(args.seed)
+    FakeYoutubeDL.latency, FakeYoutubeDL.failure_rate = args.extract_latency, args.extract_failure_rate
+    FakeYoutubeDL.playlist_size = FakeSpotify.playlist_size = args.playlist_tracks
+    FakeSpotify.latency, FakeSpotify.failure_rate = args.spotify_latency, args.spotify_failure_rate
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    spotify_module.spotipy.Spotify = FakeSpotify
+    music.make_source = lambda url, key=None, before_options=None, options=None: FakeSource()
+    music.make_file_source = lambda path: FakeSource()
+    music.SPOTIFY_CLIENT_ID = music.SPOTIFY_CLIENT_SECRET = "bench"
+    db.DB_PATH = os.path.join(workdir, "musicbot.db")
+    db.init_db()
+
+    harness = Harness(args)
+    harness.loop = asyncio.get_running_loop()
+    harness.bot = FakeBot(harness.loop)
+    harness.cog = cog = music.Music(harness.bot)
+    harness.watch_pending(cog.queue)
+
+    async def probe(url):
+        await asyncio.sleep(args.probe_latency)
+        return random.random() >= args.probe_failure_rate
+    cog.prefetcher.probe = probe
+
+    guilds = [FakeGuild(harness, i) for i in range(args.guilds)]
+    harness.bot.guilds = {guild.id: guild for guild in guilds}
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_mb()
+    lag = asyncio.create_task(harness.sample_loop_lag())
+    await cog.cog_load()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(guild_session(harness, guild, i) for i, guild in enumerate(guilds)))
+    commands_elapsed = time.perf_counter() - start
+    drained = await wait_drained(harness, args.timeout)
+    elapsed = time.perf_counter() - start
+    rss_after = rss_mb()
+    traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if args.tracemalloc else None
+
+    lag.cancel()
+    await cog.cog_unload()
+
+    commands = sum(len(samples) for samples in harness.command_latencies.values())
+    extractor = music.extractor_pool.stats()
+    return {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'args': vars(args),
+        'commands': commands,
+        'commands_per_second': commands / commands_elapsed if commands_elapsed else 0,
+        'commands_elapsed_s': commands_elapsed,
+        'elapsed_s': elapsed,
+        'drained': drained,
+        'latency': {name: summary(samples) for name, samples in sorted(harness.command_latencies.items())},
+        'pending_wait': summary(harness.pending_waits),
+        'track_gap': summary(harness.gaps),
+        'tracks_played': harness.plays,
+        'early_stops': harness.early_stops,
+        'messages_sent': harness.messages,
+        'extractions': extractor['calls'],
+        'extraction_failures': extractor['failures'],
+        'loop_lag': summary(harness.loop_lag),
+        'rss_mb': {'before': rss_before, 'after': rss_after, 'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024},
+        'tracemalloc_peak_mb': traced_peak,
+    }
+
+
+def report(results, baseline=None):
+    def change(path):
+        if baseline is None:
+            return ""
+        old, new = baseline, results
+        for key in path:
+            old, new = (old or {}).get(key), new.get(key)
+        if not old or new is None:
+            return ""
+        return f"  ({(new - old) / old * 100:+.1f}% vs {baseline.get('commit') or 'baseline'})"
+
+    args = results['args']
+    print(f"{args['guilds']} guilds x {args['tracks']} tracks (+{args['playlist_tracks']}-track YouTube and Spotify playlists): "
+          f"{results['commands']} commands in {results['commands_elapsed_s']:.2f}s, "
+          f"{results['commands_per_second']:.0f} commands/s{change(['commands_per_second'])}")
+    print(f"  {results['tracks_played']} tracks played ({results['early_stops']} stopped early), "
+          f"{results['extractions']} extractions ({results['extraction_failures']} failed), "
+          f"{'drained' if results['drained'] else 'NOT drained'} after {results['elapsed_s']:.2f}s")
+    rows = [(name, ['latency', name]) for name in results['latency']]
+    rows += [('pending wait', ['pending_wait']), ('track gap', ['track_gap']), ('loop lag', ['loop_lag'])]
+    for label, path in rows:
+        stats = results
+        for key in path:
+            stats = stats.get(key)
+        if not stats:
+            continue  # e.g. not in a results file from an older version
+        print(f"  {label:16} p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms{change(path + ['p99_ms'])}")
+    rss = results['rss_mb']
+    print(f"  memory: RSS {rss['before']:.0f} -> {rss['after']:.0f} MB (peak {rss['peak']:.0f} MB){change(['rss_mb', 'after'])}"
+          + (f", traced peak {results['tracemalloc_peak_mb']:.1f} MB" if results['tracemalloc_peak_mb'] is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--tracks', type=int, default=10, help="searches queued per guild")
+    parser.add_argument('--playlist-tracks', type=int, default=10, help="tracks in each YouTube and Spotify playlist")
+    parser.add_argument('--overlap', type=float, default=0.3, help="share of searches for songs other guilds play too")
+    parser.add_argument('--popular', type=int, default=50, help="number of distinct popular songs")
+    parser.add_argument('--extract-latency', type=float, default=0.05, help="seconds per fake yt-dlp extraction (+-50%%)")
+    parser.add_argument('--extract-failure-rate', type=float, default=0.0)
+    parser.add_argument('--spotify-latency', type=float, default=0.1, help="seconds per fake Spotify API call")
+    parser.add_argument('--spotify-failure-rate', type=float, default=0.0)
+    parser.add_argument('--probe-latency', type=float, default=0.02, help="seconds per stream URL probe")
+    parser.add_argument('--probe-failure-rate', type=float, default=0.0)
+    parser.add_argument('--send-latency', type=float, default=0.0, help="seconds per Discord message sent")
+    parser.add_argument('--track-seconds', type=float, default=0.05, help="real time each fake track plays for")
+    parser.add_argument('--early-stop-rate', type=float, default=0.0, help="share of tracks that stop early (retried)")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds to wait for every queue to finish playing")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tracemalloc', action='store_true', help="also report the traced Python heap peak (slower)")
+    parser.add_argument('--log-file', help="log the bot's INFO messages here, as the bot does (default: warnings only)")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.log_file:
+        handler = logging.FileHandler(args.log_file, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logging.getLogger().addHandler(handler)
+        logging.getLogger().setLevel(logging.INFO)
+        logging.getLogger().handlers[0].setLevel(logging.WARNING)
+    else:
+        logging.getLogger("musicbot").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="octavia-bench-", ignore_cleanup_errors=True) as workdir:
+        results = asyncio.run(run(args, workdir))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
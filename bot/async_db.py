@@ -0,0 +1,189 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bot.database as db
+import bot.metrics as metrics
+
+# Async, non-blocking reads for the bot and the dashboard. Queries run on a small thread pool;
+# each worker thread keeps one read-only connection (and with it sqlite's prepared-statement
+# cache), so the event loop never waits on disk and concurrent requests don't queue behind a
+# single connection.
+
+
+class ReadPool:
+    def __init__(self, path=None, size=4):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        self._executor = None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            path = self.path or db.DB_PATH
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+        return conn
+
+    def _fetch(self, sql, params, one):
+        with metrics.DB_READ_SECONDS.time():
+            cur = self._connection().execute(sql, params)
+            return cur.fetchone() if one else cur.fetchall()
+
+    async def fetchall(self, sql, params=()):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='db-read')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._fetch, sql, params, False)
+
+    async def fetchone(self, sql, params=()):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='db-read')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._fetch, sql, params, True)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+read_pool = ReadPool(size=db.DB_READ_POOL_SIZE)
+
+
+# Query helpers mirroring the synchronous ones in bot.database, sharing their SQL
+async def recent_playbacks(limit=10):
+    try:
+        return await read_pool.fetchall(db.SQL_RECENT_PLAYBACKS, (limit,))
+    except Exception as e:
+        print(f"DB recent_playbacks error: {e}")
+        return []
+
+async def plays(**kwargs):
+    try:
+        return await read_pool.fetchall(*db.plays_query(**kwargs))
+    except Exception as e:
+        print(f"DB plays error: {e}")
+        return []
+
+async def song_play_counts(limit=10):
+    try:
+        return await read_pool.fetchall(db.SQL_SONG_PLAY_COUNTS, (limit,))
+    except Exception as e:
+        print(f"DB song_play_counts error: {e}")
+        return []
+
+async def guild_stats():
+    try:
+        return await read_pool.fetchall(db.SQL_GUILD_STATS)
+    except Exception as e:
+        print(f"DB guild_stats error: {e}")
+        return []
+
+async def user_play_counts(limit=10):
+    try:
+        return await read_pool.fetchall(db.SQL_USER_PLAY_COUNTS, (limit,))
+    except Exception as e:
+        print(f"DB user_play_counts error: {e}")
+        return []
+
+async def hourly_play_counts(hours=24):
+    try:
+        return await read_pool.fetchall(db.SQL_HOURLY_PLAY_COUNTS, (f"-{hours} hours",))
+    except Exception as e:
+        print(f"DB hourly_play_counts error: {e}")
+        return []
+
+async def cached_stream(video_id):
+    # Stream info another process (or an earlier run) resolved and that has not expired yet
+    try:
+        row = await read_pool.fetchone(db.SQL_CACHED_STREAM, (video_id, time.time()))
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        print(f"DB cached_stream error: {e}")
+        return None
+
+async def shard_heartbeats():
+    try:
+        return await read_pool.fetchall(db.SQL_SHARD_HEARTBEATS)
+    except Exception as e:
+        print(f"DB shard_heartbeats error: {e}")
+        return []
+
+async def spotify_track(track_id):
+    try:
+        return await read_pool.fetchone(db.SQL_SPOTIFY_TRACK, (track_id,))
+    except Exception as e:
+        print(f"DB spotify_track error: {e}")
+        return None
+
+async def isrc_video_ids(isrcs, chunk=500):
+    # {isrc: video_id} for the recordings that already resolved to a YouTube video
+    isrcs = list(isrcs)
+    found = {}
+    try:
+        for i in range(0, len(isrcs), chunk):
+            part = isrcs[i:i + chunk]
+            sql = (f"SELECT isrc, video_id FROM spotify_tracks WHERE video_id IS NOT NULL "
+                   f"AND isrc IN ({', '.join('?' * len(part))})")
+            found.update(await read_pool.fetchall(sql, part))
+    except Exception as e:
+        print(f"DB isrc_video_ids error: {e}")
+    return found
+
+async def cached_video_id(query):
+    try:
+        row = await read_pool.fetchone(db.SQL_CACHED_VIDEO_ID, (query,))
+        return row[0] if row else None
+    except Exception as e:
+        print(f"DB cached_video_id error: {e}")
+        return None
+
+async def stats_version():
+    # Changes whenever playback records are written; None if it can't be read
+    try:
+        row = await read_pool.fetchone(db.SQL_STATS_VERSION)
+        return row[0] if row else None
+    except Exception as e:
+        print(f"DB stats_version error: {e}")
+        return None
+
+async def last_play_id():
+    try:
+        return (await read_pool.fetchone(db.SQL_LAST_PLAY_ID))[0]
+    except Exception as e:
+        print(f"DB last_play_id error: {e}")
+        return None
+
+async def plays_since(last_id, limit=500):
+    try:
+        return await read_pool.fetchall(db.SQL_PLAYS_SINCE, (last_id, limit))
+    except Exception as e:
+        print(f"DB plays_since error: {e}")
+        return []
+
+# Current rollup totals for just the given songs / guilds
+async def song_counts_for(songs):
+    songs = list(songs)
+    if not songs:
+        return []
+    sql = f"SELECT song, play_count FROM song_counts WHERE song IN ({', '.join('?' * len(songs))})"
+    try:
+        return await read_pool.fetchall(sql, songs)
+    except Exception as e:
+        print(f"DB song_counts_for error: {e}")
+        return []
+
+async def guild_counts_for(guild_ids):
+    guild_ids = list(guild_ids)
+    if not guild_ids:
+        return []
+    sql = f"SELECT guild_id, guild_name, play_count FROM guild_counts WHERE guild_id IN ({', '.join('?' * len(guild_ids))})"
+    try:
+        return await read_pool.fetchall(sql, guild_ids)
+    except Exception as e:
+        print(f"DB guild_counts_for error: {e}")
+        return []
@@ -0,0 +1,188 @@
+import logging
+import mmap
+import os
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import discord
+
+# opus: ask yt-dlp for Opus/WebM and hand Opus packets straight to discord (no PCM round trip).
+# pcm: decode to PCM in ffmpeg and let discord.py encode to Opus in-process (legacy behaviour).
+PLAYBACK_MODE = os.getenv("PLAYBACK_MODE", "opus")
+
+logger = logging.getLogger("musicbot")
+
+# Guilds starting the same track within BROADCAST_WINDOW seconds of each other share one ffmpeg
+# process; later starts get their own.
+BROADCAST_ENABLED = os.getenv("BROADCAST_ENABLED", "1") == "1"
+BROADCAST_WINDOW = float(os.getenv("BROADCAST_WINDOW", "10"))
+FRAME_SECONDS = 0.02  # discord reads one 20 ms frame per AudioSource.read()
+
+# Keep ffmpeg reading through transient drops of long-lived HTTP streams
+FFMPEG_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+OPUS_FORMAT = "bestaudio[acodec=opus]/bestaudio/best"
+DEFAULT_FORMAT = "bestaudio/best"
+
+# YouTube itags whose audio is Opus in a WebM container
+_OPUS_ITAGS = {"249", "250", "251"}
+
+
+def ytdl_format():
+    return OPUS_FORMAT if PLAYBACK_MODE == "opus" else DEFAULT_FORMAT
+
+
+def is_opus_stream(url):
+    # Signed googlevideo URLs describe the stream in their query string
+    params = parse_qs(urlparse(url).query)
+    mime = params.get('mime', [''])[0]
+    return mime == 'audio/webm' or params.get('itag', [''])[0] in _OPUS_ITAGS
+
+
+def _open_source(url, before_options=FFMPEG_BEFORE_OPTIONS, options=None):
+    if PLAYBACK_MODE != "opus":
+        return discord.FFmpegPCMAudio(url, before_options=before_options, options=options)
+    if is_opus_stream(url):
+        # Already Opus: remux only (-c:a copy)
+        return discord.FFmpegOpusAudio(url, codec='copy', before_options=before_options, options=options)
+    # Anything else is transcoded to Opus by ffmpeg, still skipping discord.py's encoder
+    return discord.FFmpegOpusAudio(url, before_options=before_options, options=options)
+
+
+class MmapReader:
+    # File-like reader over a memory-mapped file, for piping cached audio into ffmpeg's stdin
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.pos = 0
+
+    def read(self, size=-1):
+        if self.map.closed:
+            return b''
+        end = len(self.map) if size < 0 else min(len(self.map), self.pos + size)
+        data = self.map[self.pos:end]
+        self.pos = end
+        if not data:
+            self.map.close()
+        return data
+
+    def close(self):
+        self.map.close()
+
+
+def make_file_source(path):
+    # Play a locally cached file: the mmap-backed reader feeds ffmpeg through its stdin
+    reader = MmapReader(path)
+    if PLAYBACK_MODE != "opus":
+        return discord.FFmpegPCMAudio(reader, pipe=True)
+    codec = 'copy' if path.endswith(('.webm', '.opus', '.ogg')) else None
+    return discord.FFmpegOpusAudio(reader, pipe=True, codec=codec)
+
+
+class BroadcastHub:
+    """One ffmpeg source fanned out to every voice client playing the same track.
+
+    Frames are pulled from the source on demand by whichever subscriber is furthest ahead and kept
+    in a ring buffer that the others read from at their own cursor. The hub only accepts new
+    subscribers while frame 0 is within the join window, so everyone hears the track from the start.
+    """
+
+    def __init__(self, key, url, source, window_frames):
+        self.key = key
+        self.url = url
+        self.source = source
+        self.window = window_frames
+        self.capacity = 2 * window_frames  # slack for subscribers that start late in the window
+        self.ring = [None] * self.capacity
+        self.produced = 0
+        self.ended = False
+        self.subscribers = 0
+        self.lock = threading.Lock()
+
+    def joinable(self):
+        return not self.ended and self.produced < self.window
+
+    def frame(self, index):
+        # Returns the frame, b'' at end of stream, or None if it already left the ring buffer
+        with self.lock:
+            while self.produced <= index and not self.ended:
+                data = self.source.read()
+                if not data:
+                    self.ended = True
+                    break
+                self.ring[self.produced % self.capacity] = data
+                self.produced += 1
+            if index >= self.produced:
+                return b''
+            if index < self.produced - self.capacity:
+                return None
+            return self.ring[index % self.capacity]
+
+    def release(self):
+        with _hubs_lock:
+            self.subscribers -= 1
+            if self.subscribers > 0:
+                return
+            if _hubs.get(self.key) is self:
+                del _hubs[self.key]
+        self.source.cleanup()
+
+
+class BroadcastSource(discord.AudioSource):
+    # One voice client's view of a BroadcastHub
+    def __init__(self, hub):
+        self.hub = hub
+        self.cursor = 0
+        self.fallback = None
+        self.opus = hub.source.is_opus()
+
+    def read(self):
+        if self.fallback is not None:
+            return self.fallback.read()
+        data = self.hub.frame(self.cursor)
+        if data is None:
+            # Fell behind the shared buffer (e.g. paused): continue on a private process from here
+            offset = self.cursor * FRAME_SECONDS
+            logger.info("Broadcast subscriber fell behind on %s, reopening at %.1fs", self.hub.key, offset)
+            self.fallback = _open_source(self.hub.url, before_options=f"{FFMPEG_BEFORE_OPTIONS} -ss {offset:.2f}")
+            self._detach()
+            return self.fallback.read()
+        self.cursor += 1
+        return data
+
+    def is_opus(self):
+        return self.opus
+
+    def _detach(self):
+        if self.hub is not None:
+            self.hub.release()
+            self.hub = None
+
+    def cleanup(self):
+        self._detach()
+        if self.fallback is not None:
+            self.fallback.cleanup()
+
+
+_hubs = {}  # key: BroadcastHub
+_hubs_lock = threading.Lock()
+
+
+def make_source(url, key=None, before_options=FFMPEG_BEFORE_OPTIONS, options=None):
+    # key identifies the track (e.g. its video ID); with a key, playback is shared across guilds
+    if key is None or not BROADCAST_ENABLED or options:
+        return _open_source(url, before_options=before_options, options=options)
+    with _hubs_lock:
+        hub = _hubs.get(key)
+        if hub is None or not hub.joinable():
+            window_frames = max(1, int(BROADCAST_WINDOW / FRAME_SECONDS))
+            hub = _hubs[key] = BroadcastHub(key, url, _open_source(url, before_options=before_options), window_frames)
+        else:
+            logger.info("Sharing playback of %s (%s other listener(s))", key, hub.subscribers)
+        hub.subscribers += 1
+    return BroadcastSource(hub)
+
+
+def active_broadcasts():
+    with _hubs_lock:
+        return {key: hub.subscribers for key, hub in _hubs.items()}
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+import bot.async_db as async_db
+from .audio import make_file_source
+
+logger = logging.getLogger("musicbot")
+
+DOWNLOAD_FORMAT = "bestaudio[acodec=opus]/bestaudio"
+
+
+class AudioCache:
+    """Opt-in on-disk cache of the most played tracks, one audio file per YouTube video ID.
+
+    A background task periodically downloads the top `top_n` songs from the stats table; the
+    directory is kept under `max_bytes` by evicting the least recently played files. Recency is
+    the file's mtime, touched on every hit, so every process sharing the directory sees the same
+    order and any of them can evict. Filesystem work runs on a small executor, off the event loop.
+    """
+
+    def __init__(self, directory, max_bytes, top_n=50, refresh_interval=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.top_n = top_n
+        self.refresh_interval = refresh_interval
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-cache')
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-cache-io')  # never behind a download
+        self._task = None
+        os.makedirs(directory, exist_ok=True)
+        self.files = self._scan()  # video_id: (path, size), least recently used first
+
+    def _scan(self):
+        files = OrderedDict()
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            video_id, ext = os.path.splitext(name)
+            if ext in ('.part', '.ytdl') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, video_id, path, stat.st_size))
+        for _, video_id, path, size in sorted(entries):
+            files[video_id] = (path, size)
+        return files
+
+    async def rescan(self):
+        # Pick up files downloaded, played or evicted by other processes
+        self.files = await asyncio.get_running_loop().run_in_executor(self._io, self._scan)
+
+    async def lookup(self, video_id):
+        entry = self.files.get(video_id) if video_id else None
+        loop = asyncio.get_running_loop()
+        if entry is None or not await loop.run_in_executor(self._io, os.path.exists, entry[0]):
+            self.files.pop(video_id, None)
+            self.misses += 1
+            return None
+        self.files.move_to_end(video_id)
+        # Persist recency across restarts and for the other processes
+        loop.run_in_executor(self._io, self._touch, entry[0])
+        self.hits += 1
+        return entry[0]
+
+    async def open(self, path):
+        # Opening and mapping the file is disk I/O; do it on the I/O thread, not the event loop
+        return await asyncio.get_running_loop().run_in_executor(self._io, make_file_source, path)
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def size(self):
+        return sum(size for _, size in self.files.values())
+
+    async def evict(self):
+        # Drop least recently played files until the directory fits in max_bytes
+        total = self.size()
+        victims = []
+        while total > self.max_bytes and self.files:
+            video_id, (path, size) = self.files.popitem(last=False)
+            victims.append((video_id, path, size))
+            total -= size
+        if victims:
+            await asyncio.get_running_loop().run_in_executor(self._io, self._remove, victims)
+
+    @staticmethod
+    def _remove(victims):
+        for video_id, path, size in victims:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # e.g. already evicted by another process
+            logger.info("Audio cache evicted %s (%s KiB)", video_id, size // 1024)
+
+    def _download(self, video_id):
+        opts = {
+            'format': DOWNLOAD_FORMAT,
+            'quiet': True,
+            'outtmpl': os.path.join(self.directory, '%(id)s.%(ext)s'),
+            'socket_timeout': 30,
+        }
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+            return ydl.prepare_filename(info)
+
+    def start(self, resolve, warm=True):
+        # resolve: async (query) -> info dict with an 'id'; maps song titles to video IDs.
+        # With several bot processes sharing the directory only one warms it; the others rescan it
+        # (and evict, so the directory stays bounded whichever process touched it last).
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(resolve) if warm else self._rescan())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._io.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, resolve):
+        while True:
+            try:
+                await self.warm(resolve)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Audio cache refresh failed: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+    async def _rescan(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.rescan()
+                await self.evict()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Audio cache rescan failed: %s", e)
+
+    async def warm(self, resolve):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await self.rescan()
+        await self.evict()
+        top = await async_db.song_play_counts(self.top_n)
+        downloaded = 0
+        for song, _ in top:
+            try:
+                video_id = (await resolve(song)).get('id')
+            except Exception as e:
+                logger.warning("Audio cache could not resolve '%s': %s", song, e)
+                continue
+            if not video_id or video_id in self.files:
+                continue
+            try:
+                path = await loop.run_in_executor(self._executor, self._download, video_id)
+            except Exception as e:
+                logger.warning("Audio cache download of %s failed: %s", video_id, e)
+                continue
+            self.files[video_id] = (path, await loop.run_in_executor(self._io, os.path.getsize, path))
+            downloaded += 1
+            await self.evict()
+        logger.info("Audio cache refreshed: %s new file(s), %s cached, %s MiB in %.1fs",
+                    downloaded, len(self.files), self.size() // (1024 * 1024), time.perf_counter() - start)
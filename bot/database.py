@@ -1,11 +1,73 @@
 import sqlite3
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def get_db():
-    conn = sqlite3.connect("musicbot.db")
+import bot.metrics as metrics
+
+# One database file for the bot and the dashboard, whatever directory either is started from
+DB_PATH = os.getenv("MUSICBOT_DB", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "musicbot.db"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+
+# Read queries shared by the functions below and the async helpers in bot.async_db
+SQL_RECENT_PLAYBACKS = '''SELECT * FROM stats ORDER BY played_at DESC LIMIT ?'''
+SQL_SONG_PLAY_COUNTS = '''SELECT song, play_count FROM song_counts ORDER BY play_count DESC LIMIT ?'''
+SQL_GUILD_STATS = '''SELECT guild_id, guild_name, play_count FROM guild_counts ORDER BY play_count DESC'''
+SQL_USER_PLAY_COUNTS = '''SELECT user_id, play_count FROM user_counts ORDER BY play_count DESC LIMIT ?'''
+SQL_HOURLY_PLAY_COUNTS = '''SELECT hour, play_count FROM hourly_counts
+                            WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', ?) ORDER BY hour'''
+SQL_CACHED_VIDEO_ID = '''SELECT video_id FROM search_cache WHERE query = ?'''
+SQL_LAST_PLAY_ID = '''SELECT COALESCE(MAX(id), 0) FROM stats'''
+SQL_PLAYS_SINCE = '''SELECT id, user_id, song, guild_id, guild_name, played_at FROM stats WHERE id > ? ORDER BY id LIMIT ?'''
+SQL_CACHED_STREAM = '''SELECT info FROM stream_cache WHERE video_id = ? AND expires_at > ?'''
+SQL_SHARD_HEARTBEATS = '''SELECT shard_id, shard_count, pid, host, guilds, voice_clients, latency_ms, updated_at
+                          FROM shard_heartbeats ORDER BY shard_id'''
+SQL_SPOTIFY_TRACK = '''SELECT id, name, artist, duration, isrc, video_id FROM spotify_tracks WHERE id = ?'''
+SQL_STATS_VERSION = """SELECT value FROM meta WHERE key = 'stats_version'"""
+# Bumped in the same transaction as every write to stats, so readers can tell when cached results are stale
+SQL_BUMP_STATS_VERSION = """UPDATE meta SET value = value + 1 WHERE key = 'stats_version'"""
+
+PLAY_COLUMNS = ('id', 'user_id', 'song', 'song_url', 'duration', 'guild_id', 'guild_name', 'played_at')
+
+# Newest-first page of playback records, optionally for one guild or user and within [since, until).
+# before is the (played_at, id) of the last row of the previous page: keyset pagination, so every
+# page is an index range scan no matter how deep into the history it is.
+def plays_query(guild_id=None, user_id=None, since=None, until=None, before=None, limit=100):
+    where, params = [], []
+    if guild_id is not None:
+        where.append('guild_id = ?')
+        params.append(guild_id)
+    if user_id is not None:
+        where.append('user_id = ?')
+        params.append(user_id)
+    if since is not None:
+        where.append('played_at >= ?')
+        params.append(since)
+    if until is not None:
+        where.append('played_at < ?')
+        params.append(until)
+    if before is not None:
+        where.append('(played_at, id) < (?, ?)')
+        params.extend(before)
+    sql = f"SELECT {', '.join(PLAY_COLUMNS)} FROM stats"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY played_at DESC, id DESC LIMIT ?'
+    params.append(limit)
+    return sql, params
+
+def get_db(**kwargs):
+    conn = sqlite3.connect(DB_PATH, **kwargs)
     return conn
 
 def init_db():
     conn = get_db()
+    # WAL lets the dashboard's readers run while the bot is writing
+    conn.execute('PRAGMA journal_mode=WAL')
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS stats (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -17,8 +79,120 @@ def init_db():
         guild_name TEXT,
         played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )''')
+    # Normalized search query -> YouTube video ID, so repeat searches skip the ytsearch round trip
+    c.execute('''CREATE TABLE IF NOT EXISTS search_cache (
+        query TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )''')
+    c.execute('''INSERT OR IGNORE INTO meta (key, value) VALUES ('stats_version', 0)''')
+    # Spotify track metadata, plus the YouTube video each recording (by ISRC) resolved to
+    c.execute('''CREATE TABLE IF NOT EXISTS spotify_tracks (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        artist TEXT,
+        duration INTEGER,
+        isrc TEXT,
+        video_id TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_spotify_tracks_isrc ON spotify_tracks (isrc)''')
+    # Resolved stream URLs shared by all bot processes (and kept across restarts) until they expire
+    c.execute('''CREATE TABLE IF NOT EXISTS stream_cache (
+        video_id TEXT PRIMARY KEY,
+        info TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stream_cache_expires_at ON stream_cache (expires_at)''')
+    # Liveness of each shard, written periodically by the process running it
+    c.execute('''CREATE TABLE IF NOT EXISTS shard_heartbeats (
+        shard_id INTEGER PRIMARY KEY,
+        shard_count INTEGER NOT NULL,
+        pid INTEGER,
+        host TEXT,
+        guilds INTEGER NOT NULL DEFAULT 0,
+        voice_clients INTEGER NOT NULL DEFAULT 0,
+        latency_ms REAL,
+        updated_at REAL NOT NULL
+    )''')
+    # Queue journal for resuming playback after a restart (see bot/queue_journal.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS queue_journal (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        data TEXT,
+        created_at REAL NOT NULL
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_queue_journal_guild_id ON queue_journal (guild_id, id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stats_played_at ON stats (played_at)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stats_song ON stats (song)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stats_guild_id ON stats (guild_id)''')
+    # Per-guild and per-user history in (played_at, id) order for keyset pagination
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stats_guild_played_at ON stats (guild_id, played_at)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stats_user_played_at ON stats (user_id, played_at)''')
+    # Rollup counters so analytics queries cost O(result) instead of a GROUP BY over all history
+    c.execute('''CREATE TABLE IF NOT EXISTS song_counts (
+        song TEXT PRIMARY KEY,
+        play_count INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS guild_counts (
+        guild_id TEXT,
+        guild_name TEXT,
+        play_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, guild_name)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS user_counts (
+        user_id TEXT PRIMARY KEY,
+        play_count INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS hourly_counts (
+        hour TEXT PRIMARY KEY,
+        play_count INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_song_counts_play_count ON song_counts (play_count)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_guild_counts_play_count ON guild_counts (play_count)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_user_counts_play_count ON user_counts (play_count)''')
+    # Keep the rollups current in the same transaction as every insert (single or batched)
+    c.execute('''CREATE TRIGGER IF NOT EXISTS stats_rollup AFTER INSERT ON stats BEGIN
+        INSERT INTO song_counts (song, play_count) VALUES (NEW.song, 1)
+            ON CONFLICT (song) DO UPDATE SET play_count = play_count + 1;
+        INSERT INTO guild_counts (guild_id, guild_name, play_count) VALUES (NEW.guild_id, NEW.guild_name, 1)
+            ON CONFLICT (guild_id, guild_name) DO UPDATE SET play_count = play_count + 1;
+        INSERT INTO user_counts (user_id, play_count) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET play_count = play_count + 1;
+        INSERT INTO hourly_counts (hour, play_count) VALUES (strftime('%Y-%m-%d %H:00:00', NEW.played_at), 1)
+            ON CONFLICT (hour) DO UPDATE SET play_count = play_count + 1;
+    END''')
     conn.commit()
+    # Databases from before the rollups existed get backfilled once
+    c.execute('''SELECT EXISTS (SELECT 1 FROM stats), EXISTS (SELECT 1 FROM song_counts)''')
+    has_stats, has_rollups = c.fetchone()
     conn.close()
+    if has_stats and not has_rollups:
+        backfill_rollups()
+
+# Rebuild the rollup tables from the full stats history
+def backfill_rollups():
+    conn = get_db()
+    with conn:
+        conn.execute('''DELETE FROM song_counts''')
+        conn.execute('''DELETE FROM guild_counts''')
+        conn.execute('''DELETE FROM user_counts''')
+        conn.execute('''DELETE FROM hourly_counts''')
+        conn.execute('''INSERT INTO song_counts (song, play_count) SELECT song, COUNT(*) FROM stats GROUP BY song''')
+        conn.execute('''INSERT INTO guild_counts (guild_id, guild_name, play_count)
+                        SELECT guild_id, guild_name, COUNT(*) FROM stats GROUP BY guild_id, guild_name''')
+        conn.execute('''INSERT INTO user_counts (user_id, play_count) SELECT user_id, COUNT(*) FROM stats GROUP BY user_id''')
+        conn.execute('''INSERT INTO hourly_counts (hour, play_count)
+                        SELECT strftime('%Y-%m-%d %H:00:00', played_at), COUNT(*) FROM stats GROUP BY 1''')
+        conn.execute(SQL_BUMP_STATS_VERSION)
+    rows = conn.execute('''SELECT COUNT(*) FROM stats''').fetchone()[0]
+    conn.close()
+    return rows
 
 # Insert a playback record
 def insert_playback(user_id, song, song_url, duration, guild_id, guild_name):
@@ -27,17 +201,178 @@ def insert_playback(user_id, song, song_url, duration, guild_id, guild_name):
         c = conn.cursor()
         c.execute('''INSERT INTO stats (user_id, song, song_url, duration, guild_id, guild_name) VALUES (?, ?, ?, ?, ?, ?)''',
                   (user_id, song, song_url, duration, guild_id, guild_name))
+        c.execute(SQL_BUMP_STATS_VERSION)
         conn.commit()
         conn.close()
     except Exception as e:
         print(f"DB insert_playback error: {e}")
 
+# Write-behind buffer for playback records. record() only appends to memory; a background task
+# flushes batches with executemany over one persistent WAL-mode connection once batch_size records
+# are waiting or flush_interval seconds have passed, and close() (or interpreter exit) flushes the rest.
+class StatsWriter:
+    def __init__(self, batch_size=100, flush_interval=2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.written = 0
+        self.batches = 0
+        self._conn = None
+        self._lock = threading.Lock()  # serializes writes between the writer thread and atexit
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-writer')
+        self._wakeup = None
+        self._task = None
+        atexit.register(self.flush_sync)
+
+    def record(self, user_id, song, song_url, duration, guild_id, guild_name):
+        played_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())  # same format as CURRENT_TIMESTAMP
+        self.buffer.append((user_id, song, song_url, duration, guild_id, guild_name, played_at))
+        if len(self.buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.flush_sync)
+        self._executor.shutdown(wait=True)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self, durable=False):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._write, rows, durable)
+
+    def _connect(self):
+        # Not tied to the writer thread so the final flush can run at interpreter exit
+        conn = get_db(check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _write(self, rows, durable=False):
+        with self._lock, metrics.DB_WRITE_SECONDS.time(table='stats'):
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                if durable:
+                    self._conn.execute('PRAGMA synchronous=FULL')
+                self._conn.executemany('''INSERT INTO stats (user_id, song, song_url, duration, guild_id, guild_name, played_at) VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+                self._conn.execute(SQL_BUMP_STATS_VERSION)
+                self._conn.commit()
+                self.written += len(rows)
+                self.batches += 1
+                metrics.DB_ROWS_WRITTEN.inc(len(rows), table='stats')
+            except Exception as e:
+                print(f"DB StatsWriter flush error ({len(rows)} records): {e}")
+
+    def flush_sync(self):
+        # Final, durable flush; also runs at interpreter exit in case close() was never awaited
+        rows, self.buffer = self.buffer, []
+        if rows:
+            self._write(rows, durable=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Look up the video ID a normalized search query resolved to last time
+def get_cached_video_id(query):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute(SQL_CACHED_VIDEO_ID, (query,))
+        row = c.fetchone()
+        conn.close()
+        return row[0] if row else None
+    except Exception as e:
+        print(f"DB get_cached_video_id error: {e}")
+        return None
+
+# Remember which video ID a normalized search query resolved to
+def cache_video_id(query, video_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('''INSERT OR REPLACE INTO search_cache (query, video_id, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)''',
+                  (query, video_id))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"DB cache_video_id error: {e}")
+
+# Share a resolved stream (slim info dict) with the other bot processes until expires_at
+def cache_stream(video_id, info, expires_at):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('''INSERT OR REPLACE INTO stream_cache (video_id, info, expires_at) VALUES (?, ?, ?)''',
+                  (video_id, json.dumps(info), expires_at))
+        c.execute('''DELETE FROM stream_cache WHERE expires_at <= ?''', (time.time(),))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"DB cache_stream error: {e}")
+
+# Remember Spotify track metadata; rows are (id, name, artist, duration, isrc). Known video IDs are kept.
+def cache_spotify_tracks(rows):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.executemany('''INSERT INTO spotify_tracks (id, name, artist, duration, isrc) VALUES (?, ?, ?, ?, ?)
+                         ON CONFLICT (id) DO UPDATE SET name = excluded.name, artist = excluded.artist,
+                         duration = excluded.duration, isrc = COALESCE(excluded.isrc, isrc), updated_at = CURRENT_TIMESTAMP''', rows)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"DB cache_spotify_tracks error: {e}")
+
+# Remember which YouTube video a Spotify track (and every other track with its ISRC) resolved to
+def set_spotify_video_id(track_id, isrc, video_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('''UPDATE spotify_tracks SET video_id = ? WHERE id = ? OR isrc = ?''', (video_id, track_id, isrc))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"DB set_spotify_video_id error: {e}")
+
+# Upsert one heartbeat row per shard run by this process
+def record_shard_heartbeats(rows):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.executemany('''INSERT OR REPLACE INTO shard_heartbeats
+                         (shard_id, shard_count, pid, host, guilds, voice_clients, latency_ms, updated_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"DB record_shard_heartbeats error: {e}")
+
 # Get recent playbacks
 def get_recent_playbacks(limit=10):
     try:
         conn = get_db()
         c = conn.cursor()
-        c.execute('''SELECT * FROM stats ORDER BY played_at DESC LIMIT ?''', (limit,))
+        c.execute(SQL_RECENT_PLAYBACKS, (limit,))
         results = c.fetchall()
         conn.close()
         return results
@@ -45,12 +380,25 @@ def get_recent_playbacks(limit=10):
         print(f"DB get_recent_playbacks error: {e}")
         return []
 
+# Get a page of playback history (see plays_query)
+def get_plays(**kwargs):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute(*plays_query(**kwargs))
+        results = c.fetchall()
+        conn.close()
+        return results
+    except Exception as e:
+        print(f"DB get_plays error: {e}")
+        return []
+
 # Get song play counts for analytics (top N songs)
 def get_song_play_counts(limit=10):
     try:
         conn = get_db()
         c = conn.cursor()
-        c.execute('''SELECT song, COUNT(*) as play_count FROM stats GROUP BY song ORDER BY play_count DESC LIMIT ?''', (limit,))
+        c.execute(SQL_SONG_PLAY_COUNTS, (limit,))
         results = c.fetchall()
         conn.close()
         return results
@@ -63,10 +411,45 @@ def get_guild_stats():
     try:
         conn = get_db()
         c = conn.cursor()
-        c.execute('''SELECT guild_id, guild_name, COUNT(*) as play_count FROM stats GROUP BY guild_id, guild_name ORDER BY play_count DESC''')
+        c.execute(SQL_GUILD_STATS)
         results = c.fetchall()
         conn.close()
         return results
     except Exception as e:
         print(f"DB get_guild_stats error: {e}")
-        return [] 
\ No newline at end of file
+        return [] 
+
+# Get user stats (top N listeners)
+def get_user_play_counts(limit=10):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute(SQL_USER_PLAY_COUNTS, (limit,))
+        results = c.fetchall()
+        conn.close()
+        return results
+    except Exception as e:
+        print(f"DB get_user_play_counts error: {e}")
+        return []
+
+# Get plays per hour for the last N hours
+def get_hourly_play_counts(hours=24):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute(SQL_HOURLY_PLAY_COUNTS, (f"-{hours} hours",))
+        results = c.fetchall()
+        conn.close()
+        return results
+    except Exception as e:
+        print(f"DB get_hourly_play_counts error: {e}")
+        return []
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Octavia database maintenance")
+    parser.add_argument("command", choices=["init", "backfill"])
+    args = parser.parse_args()
+    init_db()
+    if args.command == "backfill":
+        print(f"Rebuilt rollups from {backfill_rollups()} playback records.")
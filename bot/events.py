@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("musicbot")
+
+
+class EventBus:
+    """In-process publish/subscribe: every subscriber gets its own bounded asyncio.Queue.
+
+    publish() never waits. A subscriber that falls more than `backlog` events behind is cut
+    off (its queue receives None) rather than slowing down everyone else.
+    """
+
+    def __init__(self, backlog=100):
+        self.backlog = backlog
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.backlog)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event):
+        self.published += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.subscribers.discard(queue)
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                logger.warning("Dropped a slow event subscriber")
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import yt_dlp
+
+import bot.metrics as metrics
+from .logs import sampled
+
+logger = logging.getLogger("musicbot")
+
+# Worker-side state: each worker thread (or process) keeps its own long-lived YoutubeDL
+# instances, one per distinct option set, so extractors and the HTTP session are set up once.
+_local = threading.local()
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def _get_ydl(ydl_opts):
+    instances = getattr(_local, 'instances', None)
+    if instances is None:
+        instances = _local.instances = {}
+    key = repr(sorted(ydl_opts.items()))
+    ydl = instances.get(key)
+    if ydl is None:
+        ydl = instances[key] = yt_dlp.YoutubeDL(ydl_opts)
+    return ydl
+
+
+def _warmup(ydl_opts, hold):
+    _get_ydl(ydl_opts)
+    # Stay busy briefly so the other warmup calls land on other workers
+    time.sleep(hold)
+
+
+def _extract(query, ydl_opts, sanitize):
+    ydl = _get_ydl(ydl_opts)
+    if not sanitize:
+        return ydl.extract_info(query, download=False)
+    # Results and errors crossing a process boundary must be picklable
+    try:
+        return ydl.sanitize_info(ydl.extract_info(query, download=False))
+    except Exception as e:
+        raise ExtractionError(str(e)) from None
+
+
+class ExtractorPool:
+    """Bounded pool of long-lived YoutubeDL workers.
+
+    At most `size` extractions run at once and up to `max_pending` more wait in line; callers
+    beyond that wait (backpressure) for up to `queue_timeout` seconds before giving up.
+    """
+
+    def __init__(self, ydl_opts, size=4, backend='thread', max_pending=64, queue_timeout=60):
+        if backend not in ('thread', 'process'):
+            raise ValueError(f"Unknown extractor backend: {backend}")
+        self.ydl_opts = ydl_opts
+        self.size = size
+        self.backend = backend
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.executor = None
+        self._slots = None
+        self._submitted = 0  # calls handed to the executor and not finished
+        self._waiting = 0  # calls waiting for a slot
+        self.calls = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=512)
+
+    async def start(self):
+        if self.executor is not None:
+            return
+        if self.backend == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.size)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='ytdlp')
+        self._slots = asyncio.Semaphore(self.size + self.max_pending)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _warmup, self.ydl_opts, 0.2)
+            for _ in range(self.size)
+        ))
+        logger.info("Extractor pool started: %s %s workers warmed up in %.2fs",
+                    self.size, self.backend, time.perf_counter() - start)
+
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    @property
+    def queue_depth(self):
+        return max(0, self._submitted - self.size) + self._waiting
+
+    async def extract(self, query, ydl_opts=None):
+        if self.executor is None:
+            await self.start()
+        ydl_opts = ydl_opts or self.ydl_opts
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.EXTRACTION_SECONDS.observe(time.perf_counter() - start, status='timeout')
+            raise
+        finally:
+            self._waiting -= 1
+        self._submitted += 1
+        status = 'ok'
+        try:
+            call = functools.partial(_extract, query, ydl_opts, self.backend == 'process')
+            return await loop.run_in_executor(self.executor, call)
+        except Exception:
+            self.failures += 1
+            status = 'error'
+            raise
+        finally:
+            self._submitted -= 1
+            self._slots.release()
+            latency = time.perf_counter() - start
+            self.calls += 1
+            self.latencies.append(latency)
+            metrics.EXTRACTION_SECONDS.observe(latency, status=status)
+            logger.info("Extraction of '%s' took %.2fs (queue depth %s)", query, latency, self.queue_depth,
+                        extra=sampled(None))
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        return {
+            'backend': self.backend,
+            'size': self.size,
+            'queue_depth': self.queue_depth,
+            'in_flight': self._submitted,
+            'calls': self.calls,
+            'failures': self.failures,
+            'latency_p50': pct(0.5),
+            'latency_p95': pct(0.95),
+        }
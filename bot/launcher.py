@@ -0,0 +1,99 @@
+"""Run the bot as several worker processes, each owning a contiguous range of shards.
+
+Every worker is a normal `python -m bot.main` with SHARD_COUNT/SHARD_IDS set, so each gets its own
+event loop (and core) for the gateway, ffmpeg supervision and yt-dlp callbacks. Workers share the
+SQLite database: stats, the search and stream caches, queue journals and shard heartbeats.
+Crashed workers are restarted with a backoff.
+
+Usage: python -m bot.launcher [--processes 4] [--shards 8]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+import bot.database as db
+from .shards import shard_ranges
+
+MAX_BACKOFF = 60
+
+
+def recommended_shards(token):
+    request = urllib.request.Request("https://discord.com/api/v10/gateway/bot",
+                                     headers={"Authorization": f"Bot {token}", "User-Agent": "Octavia launcher"})
+    with urllib.request.urlopen(request, timeout=10) as resp:
+        return json.load(resp)["shards"]
+
+
+def spawn(shard_count, shards, index):
+    env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=f"{shards.start}-{shards.stop - 1}")
+    # Each worker serves its own /metrics, on consecutive ports
+    env["METRICS_PORT"] = str(int(os.getenv("METRICS_PORT", "9100")) + index)
+    # ...and rotates its own log file: rotation is not safe across processes
+    log_file = os.getenv("LOG_FILE", "musicbot.log")
+    if log_file:
+        root, ext = os.path.splitext(log_file)
+        env["LOG_FILE"] = f"{root}-{index}{ext}"
+    print(f"Starting worker for shards {shards.start}-{shards.stop - 1} of {shard_count}")
+    return subprocess.Popen([sys.executable, "-m", "bot.main"], env=env)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shards', type=int, help="total shard count (default: Discord's recommendation, "
+                                                   "at least one per process)")
+    args = parser.parse_args()
+
+    shard_count = args.shards or max(recommended_shards(os.getenv("DISCORD_TOKEN")), args.processes)
+    ranges = shard_ranges(shard_count, min(args.processes, shard_count))
+    db.init_db()  # once, before the workers race to create the schema
+
+    workers = {}  # range: [process, restarts, restart_at]
+    for shards in ranges:
+        workers[shards] = [spawn(shard_count, shards, len(workers)), 0, None]
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    while not stopping:
+        time.sleep(1)
+        now = time.monotonic()
+        for shards, worker in workers.items():
+            process, restarts, restart_at = worker
+            if restart_at is not None:
+                if now >= restart_at:
+                    worker[:] = [spawn(shard_count, shards, ranges.index(shards)), restarts, None]
+                continue
+            code = process.poll()
+            if code is None:
+                continue
+            delay = min(MAX_BACKOFF, 2 ** restarts)
+            print(f"Worker for shards {shards.start}-{shards.stop - 1} exited with {code}, restarting in {delay}s")
+            worker[1:] = [restarts + 1, now + delay]
+
+    # Let each worker shut down cleanly (its cogs flush stats and queue journals)
+    for process, _, _ in workers.values():
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for process, _, _ in workers.values():
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == "__main__":
+    main()
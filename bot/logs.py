@@ -0,0 +1,163 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+LOG_FILE = os.getenv("LOG_FILE", "musicbot.log")  # empty: log to stderr only
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 2 ** 20)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))  # sampled records per guild and event...
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "10"))  # ...per this many seconds
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_listener = None
+
+
+def sampled(guild_id):
+    # logger.info("...", arg, extra=sampled(guild_id)): a high-frequency event, rate-limited per guild
+    return {'guild_id': guild_id, 'sample': True}
+
+
+class GuildSampler(logging.Filter):
+    """Rate-limits high-frequency records per guild.
+
+    Records logged with extra=sampled(guild_id) pass at most `burst` times per `interval` seconds
+    for each guild and message template; the rest are dropped before they reach the queue, and the
+    next one to pass says how many were suppressed. Other records always pass.
+    """
+
+    def __init__(self, burst=LOG_SAMPLE_BURST, interval=LOG_SAMPLE_INTERVAL, max_keys=10000):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        self.windows = OrderedDict()  # (guild_id, msg): [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sample', False) or self.burst <= 0:
+            return True
+        key = (getattr(record, 'guild_id', None), record.msg)
+        with self._lock:
+            window = self.windows.get(key)
+            if window is not None and record.created - window[0] < self.interval:
+                if window[1] >= self.burst:
+                    window[2] += 1
+                    return False
+                window[1] += 1
+                return True
+            suppressed = window[2] if window is not None else 0
+            self.windows[key] = [record.created, 1, 0]
+            self.windows.move_to_end(key)
+            if len(self.windows) > self.max_keys:
+                self.windows.popitem(last=False)
+        if suppressed and isinstance(record.args, tuple):
+            record.msg = f"{record.msg} (%d similar suppressed)"
+            record.args = record.args + (suppressed,)
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread.
+
+    The stock prepare() formats the message (and any traceback) on the logging thread so the
+    record can be pickled; ours only crosses threads, so the caller pays for creating the record
+    and one put_nowait(). Arguments are formatted later, so pass values rather than objects that
+    are about to change. When the queue is full the record is dropped and counted instead of
+    blocking the event loop behind a slow disk.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; guild_id and other extra= fields are kept as keys
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample'}
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def skip_unused_record_fields():
+    # Neither format uses thread or process names; the logging module's switches skip looking them
+    # up for every record (see "Optimization" in the logging HOWTO)
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+
+def setup_logging():
+    """Send every record through a queue to a background writer thread.
+
+    Log calls on the event loop only build the record and enqueue it; the listener thread formats
+    it (text or JSON) and writes it to stderr and a size-rotated LOG_FILE. Safe to call more than
+    once. Returns the listener, which is stopped (and flushed) at exit.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    skip_unused_record_fields()
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    handler = LazyQueueHandler(records)
+    handler.addFilter(GuildSampler())
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    # Write out whatever is still queued; called at exit
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -2,25 +2,52 @@ import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
+from .logs import setup_logging
+from .shards import ShardHeartbeat, parse_shard_ids
 
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+# Sharding: SHARD_COUNT=auto uses Discord's recommended count, a number fixes it; SHARD_IDS
+# ("0-3,6") limits this process to some of them (see bot/launcher.py). Unset: one unsharded bot.
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS"))
+SHARD_HEARTBEAT_INTERVAL = float(os.getenv("SHARD_HEARTBEAT_INTERVAL", "15"))
+if SHARD_IDS is not None and SHARD_COUNT in (None, "", "auto"):
+    # discord.py only accepts shard_ids with a fixed shard_count
+    raise SystemExit("SHARD_IDS needs a numeric SHARD_COUNT (not auto); bot.launcher sets both")
 
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS,
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+
+heartbeat = ShardHeartbeat(bot, interval=SHARD_HEARTBEAT_INTERVAL)
 
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user}")
+    heartbeat.start()
 
 async def main():
-    await bot.load_extension("bot.music")
-    await bot.start(DISCORD_TOKEN)
+    # `async with` closes the bot on exit, which unloads the cogs so they can flush their state
+    async with bot:
+        await bot.load_extension("bot.music")
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            await heartbeat.close()
 
 if __name__ == "__main__":
+    setup_logging()
     import bot.database as db
     db.init_db()
     import asyncio
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("musicbot")
+
+# Off by default; when disabled every update is a single flag check and nothing is recorded
+ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                          for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {}  # label values tuple: value
+        self.function = None
+        self._lock = threading.Lock()  # updates also come from worker threads
+        _registry.append(self)
+
+    def set_function(self, function):
+        # Compute the value at scrape time instead: function() returns a number, or a dict of
+        # label values tuple -> number
+        self.function = function
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        if self.function is None:
+            return list(self.values.items())
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning("Metric %s could not be collected: %s", self.name, e)
+            return []
+        return list(value.items()) if isinstance(value, dict) else [((), value)]
+
+    def render(self):
+        samples = self.samples()
+        if not samples:
+            return []  # e.g. the bot's metrics in the dashboard process
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not ENABLED:
+            return
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]  # counts, sum, count
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        # with histogram.time(op="add"): ...
+        return _Timer(self, labels) if ENABLED else _NOOP_TIMER
+
+    def render(self):
+        with self._lock:
+            entries = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        if not entries:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, counts, total, count in entries:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render():
+    # Prometheus text exposition format
+    if not ENABLED:
+        return "# metrics disabled (set METRICS_ENABLED=1)\n"
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    # Measures how late the event loop wakes up from a short sleep: time it spent blocked
+    def __init__(self, histogram, interval=0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(max(0.0, time.perf_counter() - start - self.interval))
+
+
+async def start_http_server(port, host="0.0.0.0"):
+    # Minimal /metrics listener for the bot process; returns the aiohttp runner to clean up
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return runner
+
+
+# Shared by the bot and the dashboard
+LOOP_LAG_SECONDS = Histogram("musicbot_event_loop_lag_seconds", "How late the event loop woke up from a sleep")
+DB_READ_SECONDS = Histogram("musicbot_db_read_seconds", "Pooled read-only database query latency", buckets=FAST_BUCKETS + (0.1, 0.5, 1))
+
+# Bot hot paths
+EXTRACTION_SECONDS = Histogram("musicbot_extraction_seconds", "yt-dlp extraction latency, including queueing for a worker", ("status",))
+EXTRACTOR_QUEUE_DEPTH = Gauge("musicbot_extractor_queue_depth", "Extractions running or waiting for a worker")
+RESOLUTION_CACHE_LOOKUPS = Counter("musicbot_resolution_cache_lookups_total", "Stream URL cache lookups", ("result",))
+BACKGROUND_RESOLUTIONS = Counter("musicbot_background_resolutions_total", "Pending tracks resolved by the background resolver", ("result",))
+QUEUE_OP_SECONDS = Histogram("musicbot_queue_op_seconds", "MusicQueue operation latency", ("op",), buckets=FAST_BUCKETS)
+QUEUE_DEPTH = Gauge("musicbot_queue_depth", "Tracks queued, per guild", ("guild",))
+PLAYBACK_START_SECONDS = Histogram("musicbot_playback_start_seconds", "Time from picking the next track to handing its audio to discord")
+TRACK_GAP_SECONDS = Histogram("musicbot_track_gap_seconds", "Silence between one track ending and the next one starting")
+PLAYBACK_RETRIES = Counter("musicbot_playback_retries_total", "Tracks that stopped early and were retried")
+PLAYBACK_SKIPS = Counter("musicbot_playback_skips_total", "Tracks skipped because they could not be played", ("reason",))
+FFMPEG_PROCESSES = Gauge("musicbot_ffmpeg_processes", "ffmpeg processes feeding voice clients")
+VOICE_CLIENTS = Gauge("musicbot_voice_clients", "Connected voice clients")
+DB_WRITE_SECONDS = Histogram("musicbot_db_write_seconds", "Batched database write latency (off the event loop)", ("table",))
+DB_ROWS_WRITTEN = Counter("musicbot_db_rows_written_total", "Rows written by the batched writers", ("table",))
@@ -1,27 +1,30 @@
 import discord
 from discord.ext import commands
-import yt_dlp
-import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import re
 import os
 from dotenv import load_dotenv
 import logging
-import functools
 from .music_queue import MusicQueue
+from .extractor import ExtractorPool
+from .resolver import ResolverScheduler
+from .prefetch import Prefetcher
+from .audio import FFMPEG_BEFORE_OPTIONS, BroadcastSource, make_source, ytdl_format
+from .audio_cache import AudioCache
+from .queue_journal import PlaybackContext, QueueJournal, restore_track
+from .resolve_cache import ResolutionCache, normalize_query, youtube_video_id
+from .shards import owns_guild
+from .spotify import SpotifyIngest
+from .timers import TimerHeap
 import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
 import bot.database as db
+import bot.async_db as async_db
+import bot.metrics as metrics
+from .logs import sampled
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s: %(message)s',
-    handlers=[
-        logging.FileHandler('musicbot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Handlers are set up by bot.main (see bot/logs.py)
 logger = logging.getLogger("musicbot")
 
 # Load environment variables from .env
@@ -29,34 +32,312 @@ load_dotenv()
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+SPOTIFY_WORKERS = int(os.getenv("SPOTIFY_WORKERS", "4"))  # concurrent Spotify API page fetches
+RESOLVE_CACHE_SIZE = int(os.getenv("RESOLVE_CACHE_SIZE", "2048"))
+RESOLVE_CACHE_TTL = int(os.getenv("RESOLVE_CACHE_TTL", "3600"))  # used when a stream URL has no expire=
+EXTRACTOR_POOL_SIZE = int(os.getenv("EXTRACTOR_POOL_SIZE", "4"))
+EXTRACTOR_BACKEND = os.getenv("EXTRACTOR_BACKEND", "thread")  # thread | process
+EXTRACTOR_QUEUE_SIZE = int(os.getenv("EXTRACTOR_QUEUE_SIZE", "64"))
+EXTRACTOR_QUEUE_TIMEOUT = float(os.getenv("EXTRACTOR_QUEUE_TIMEOUT", "60"))
+RESOLVER_CONCURRENCY = int(os.getenv("RESOLVER_CONCURRENCY", "4"))
+RESOLVER_RATE = float(os.getenv("RESOLVER_RATE", "2"))  # pending tracks resolved per second, all guilds
+RESOLVER_BURST = int(os.getenv("RESOLVER_BURST", "4"))
+PREFETCH_TRACKS = int(os.getenv("PREFETCH_TRACKS", "2"))  # queued tracks kept ready ahead of playback
+PREFETCH_REFRESH_MARGIN = int(os.getenv("PREFETCH_REFRESH_MARGIN", "600"))  # re-resolve URLs expiring sooner
+STATS_BATCH_SIZE = int(os.getenv("STATS_BATCH_SIZE", "100"))
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "2"))
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR")  # set to enable the on-disk cache of hot tracks
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+AUDIO_CACHE_TOP_N = int(os.getenv("AUDIO_CACHE_TOP_N", "50"))
+AUDIO_CACHE_REFRESH = int(os.getenv("AUDIO_CACHE_REFRESH", "3600"))
+QUEUE_JOURNAL = os.getenv("QUEUE_JOURNAL", "1") == "1"  # persist queues and resume them after a restart
+JOURNAL_CHECKPOINT_INTERVAL = float(os.getenv("JOURNAL_CHECKPOINT_INTERVAL", "15"))  # seconds between saved positions
+JOURNAL_COMPACT_AFTER = int(os.getenv("JOURNAL_COMPACT_AFTER", "200"))  # entries per guild before a snapshot
+IDLE_DISCONNECT_AFTER = float(os.getenv("IDLE_DISCONNECT_AFTER", "300"))  # seconds without music before leaving voice
+STATE_EVICT_AFTER = 60  # seconds after leaving voice before a guild's playback state is dropped
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # bot-side /metrics listener, when METRICS_ENABLED=1
+
+YDL_OPTS = {
+    'format': ytdl_format(),
+    'quiet': True,
+    'default_search': 'ytsearch',
+    'noplaylist': False,
+    'extract_flat': False,
+    'socket_timeout': 30,
+}
+
+# Playlists are only listed (IDs and titles, one request per page); entries resolve individually later
+YDL_FLAT_OPTS = {**YDL_OPTS, 'extract_flat': 'in_playlist'}
+
+resolution_cache = ResolutionCache(max_entries=RESOLVE_CACHE_SIZE, default_ttl=RESOLVE_CACHE_TTL)
+# Resolutions are shared through SQLite in the background, one write at a time; resolving never
+# waits for the commit, and pending writes still finish at exit
+cache_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-write')
+extractor_pool = ExtractorPool(
+    YDL_OPTS,
+    size=EXTRACTOR_POOL_SIZE,
+    backend=EXTRACTOR_BACKEND,
+    max_pending=EXTRACTOR_QUEUE_SIZE,
+    queue_timeout=EXTRACTOR_QUEUE_TIMEOUT,
+)
 
-# Helper for yt-dlp extraction in a thread
+# Helper for yt-dlp extraction on the shared worker pool
 async def extract_info_async(loop, query, ydl_opts):
-    def ytdlp_extract(query, ydl_opts):
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            return ydl.extract_info(query, download=False)
-    return await loop.run_in_executor(None, functools.partial(ytdlp_extract, query, ydl_opts))
+    return await extractor_pool.extract(query, ydl_opts)
+
+def is_single_track_query(query):
+    # Plain searches and single YouTube videos can be cached; other URLs may be playlists
+    if not re.match(r"https?://", query.strip()):
+        return True
+    return youtube_video_id(query) is not None and "list=" not in query
+
+# Resolve one track (search text or YouTube video URL) to a slim info dict, going through the
+# resolution cache. Searches map to a video ID (memory, then SQLite) so that only the
+# short-lived stream URL has to be re-extracted. refresh=True skips the cached stream URL.
+async def resolve_track(loop, query, ydl_opts=YDL_OPTS, refresh=False, video_id=None):
+    # video_id, when already known (e.g. from a Spotify ISRC match), skips the search entirely
+    key = normalize_query(query)
+    video_id = video_id or youtube_video_id(query) or resolution_cache.get_video_id(key)
+    if video_id is None:
+        video_id = await async_db.cached_video_id(key)
+        if video_id:
+            resolution_cache.put_video_id(key, video_id)
+    info = None if refresh else resolution_cache.get_stream(video_id or key)
+    if info is None and video_id and not refresh:
+        # Another bot process (or the previous run) may already have resolved it
+        info = await async_db.cached_stream(video_id)
+        if info is not None:
+            resolution_cache.put_stream(video_id, info)
+    if info is not None:
+        logger.info("Resolution cache hit for '%s' (%s)", query, video_id or key, extra=sampled(None))  # across guilds
+        return info
+    target = f"https://www.youtube.com/watch?v={video_id}" if video_id else query
+    info = await extract_info_async(loop, target, ydl_opts)
+    if 'entries' in info:
+        info = info['entries'][0]
+    is_youtube = (info.get('extractor_key') or '').startswith('Youtube') and info.get('id')
+    info = {
+        'id': info.get('id'),
+        'url': info['url'],
+        'title': info.get('title', 'Unknown Title'),
+        'duration': info.get('duration', 0),
+        'webpage_url': info.get('webpage_url'),
+    }
+    if is_youtube:
+        expires_at = resolution_cache.put_stream(info['id'], info)
+        if expires_at is not None:
+            cache_writer.submit(db.cache_stream, info['id'], info, expires_at)
+        if video_id is None:
+            resolution_cache.put_video_id(key, info['id'])
+            cache_writer.submit(db.cache_video_id, key, info['id'])
+    else:
+        resolution_cache.put_stream(key, info)
+    return info
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.queue = MusicQueue()
-        self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+        self.spotify = SpotifyIngest(SpotifyClientCredentials(
             client_id=SPOTIFY_CLIENT_ID,
             client_secret=SPOTIFY_CLIENT_SECRET
-        ))
+        ), workers=SPOTIFY_WORKERS)
         logger.info("Music cog initialized.")
-        self.resolver_tasks = {}  # guild_id: asyncio.Task
-        self.song_start_times = {}  # guild_id: (start_time, retries, url, title, ctx, duration, requester, search_query)
-        self.disconnect_timers = {}  # guild_id: asyncio.Task
-        self.last_text_channel = {}  # guild_id: ctx.channel
+        self.stats = db.StatsWriter(batch_size=STATS_BATCH_SIZE, flush_interval=STATS_FLUSH_INTERVAL)
+        # Every per-guild deadline (idle disconnect, prefetch recheck, state eviction) runs off this
+        self.timers = TimerHeap()
+        self.resolver = ResolverScheduler(
+            self.queue,
+            lambda query, video_id: self.resolve_queued(query, video_id),
+            concurrency=RESOLVER_CONCURRENCY,
+            rate=RESOLVER_RATE,
+            burst=RESOLVER_BURST,
+        )
+        self.prefetcher = Prefetcher(
+            self.queue,
+            lambda query, refresh, video_id: self.resolve_queued(query, video_id, refresh),
+            lookahead=PREFETCH_TRACKS,
+            refresh_margin=PREFETCH_REFRESH_MARGIN,
+            timers=self.timers,
+        )
+        self.audio_cache = None
+        if AUDIO_CACHE_DIR:
+            self.audio_cache = AudioCache(
+                AUDIO_CACHE_DIR,
+                AUDIO_CACHE_MAX_MB * 1024 * 1024,
+                top_n=AUDIO_CACHE_TOP_N,
+                refresh_interval=AUDIO_CACHE_REFRESH,
+            )
+        self.song_start_times = {}  # guild_id: (start_time, retries, url, title, channel_id, duration, requester, search_query)
+        self.last_text_channel = {}  # guild_id: channel ID of the last "Now playing" message
+        self.journal = None
+        if QUEUE_JOURNAL:
+            self.journal = QueueJournal(compact_after=JOURNAL_COMPACT_AFTER)
+            self.queue.journal = self.journal
+        self.saved_guilds = set()  # guild_ids with a journaled queue not yet rehydrated
+        self.rehydrations = {}  # guild_id: asyncio.Task
+        self._checkpoint_task = None
+        self.track_ended = {}  # guild_id: perf_counter() when the last track stopped, for the gap metric
+        self.loop_lag = metrics.LoopLagMonitor(metrics.LOOP_LAG_SECONDS)
+        self._metrics_runner = None
+
+    async def cog_load(self):
+        await extractor_pool.start()
+        self.timers.start()
+        self.resolver.start()
+        self.stats.start()
+        if self.audio_cache:
+            # When sharded across processes, the one running shard 0 does the downloading
+            self.audio_cache.start(lambda query: resolve_track(asyncio.get_running_loop(), query),
+                                   warm=not getattr(self.bot, 'shard_ids', None) or 0 in self.bot.shard_ids)
+        if self.journal:
+            saved = await asyncio.get_running_loop().run_in_executor(None, self.journal.saved_guilds)
+            # Other processes resume the guilds on their shards
+            self.saved_guilds = {guild_id for guild_id in saved if owns_guild(self.bot, guild_id)}
+            self.journal.start()
+            self._checkpoint_task = asyncio.create_task(self.checkpoint_loop())
+        if metrics.ENABLED:
+            await self.start_metrics()
+
+    async def start_metrics(self):
+        # Values that already exist elsewhere are read at scrape time rather than tracked twice
+        metrics.EXTRACTOR_QUEUE_DEPTH.set_function(lambda: extractor_pool.queue_depth)
+        metrics.RESOLUTION_CACHE_LOOKUPS.set_function(
+            lambda: {('hit',): resolution_cache.hits, ('miss',): resolution_cache.misses})
+        metrics.BACKGROUND_RESOLUTIONS.set_function(
+            lambda: {('resolved',): self.resolver.resolved, ('failed',): self.resolver.failed})
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: {(str(guild_id),): len(tracks) for guild_id, tracks in list(self.queue.queues.items()) if tracks})
+        metrics.FFMPEG_PROCESSES.set_function(self.ffmpeg_processes)
+        metrics.VOICE_CLIENTS.set_function(lambda: len(self.bot.voice_clients))
+        self.loop_lag.start()
+        try:
+            self._metrics_runner = await metrics.start_http_server(METRICS_PORT)
+        except OSError as e:
+            logger.error("Could not serve metrics on port %s: %s", METRICS_PORT, e)
+
+    def ffmpeg_processes(self):
+        # Voice clients on the same broadcast share one ffmpeg process
+        hubs, private = set(), 0
+        for vc in self.bot.voice_clients:
+            source = getattr(vc, 'source', None)
+            if isinstance(source, BroadcastSource) and source.fallback is None and source.hub is not None:
+                hubs.add(id(source.hub))
+            elif source is not None:
+                private += 1
+        return len(hubs) + private
+
+    async def cog_unload(self):
+        await self.loop_lag.close()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+        if self.journal:
+            self._checkpoint_task.cancel()
+            self.checkpoint()
+            await self.journal.close()
+        await self.resolver.close()
+        await self.prefetcher.close()
+        await self.timers.close()
+        if self.audio_cache:
+            await self.audio_cache.close()
+        self.spotify.close()
+        await extractor_pool.close()
+        await self.stats.close()
+        async_db.read_pool.close()
+
+    async def cog_before_invoke(self, ctx):
+        # A guild's saved queue is rehydrated at the latest when someone uses a command there
+        if ctx.guild is not None:
+            task = self.rehydrate(ctx.guild.id)
+            if task is not None:
+                await asyncio.shield(task)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Resume the guilds that had a queue when the bot last stopped, one at a time so a
+        # restart does not turn into a burst of resolutions
+        for guild_id in list(self.saved_guilds):
+            task = self.rehydrate(guild_id)
+            if task is not None:
+                await asyncio.shield(task)
+
+    async def checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(JOURNAL_CHECKPOINT_INTERVAL)
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.error("Queue journal checkpoint failed: %s", e)
+
+    def checkpoint(self):
+        # Save how far into its track each playing guild is, and compact journals that grew long
+        now = time.time()
+        for guild_id, entry in list(self.song_start_times.items()):
+            guild = self.bot.get_guild(guild_id)
+            vc = guild.voice_client if guild else None
+            if vc and vc.is_playing():
+                self.journal.progress(guild_id, round(now - entry[0], 1))
+        for guild_id in list(self.journal.since_snapshot):
+            if self.journal.needs_compaction(guild_id):
+                self.journal.snapshot(guild_id, self.queue.get_queue(guild_id), self.queue.get_now_playing(guild_id))
+
+    def rehydrate(self, guild_id):
+        # Returns the guild's rehydration task while it runs, else None
+        if guild_id in self.saved_guilds:
+            self.saved_guilds.discard(guild_id)
+            task = self.rehydrations[guild_id] = asyncio.create_task(self._rehydrate(guild_id))
+            task.add_done_callback(lambda t: self.rehydrations.pop(guild_id, None))
+        return self.rehydrations.get(guild_id)
+
+    async def _rehydrate(self, guild_id):
+        try:
+            await self.restore_queue(guild_id)
+        except Exception as e:
+            logger.error("Failed to restore the saved queue in guild %s: %s", guild_id, e)
+
+    async def restore_queue(self, guild_id):
+        state = await asyncio.get_running_loop().run_in_executor(None, self.journal.load, guild_id)
+        if state is None:
+            return
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            self.journal.clear(guild_id)  # no longer in that guild
+            return
+        records = state['tracks']
+        if state['now_playing']:
+            # The interrupted track goes back to the head of the queue
+            records = [state['now_playing']] + records
+        tracks = [restore_track(record) for record in records]
+        self.queue.restore(guild_id, tracks)
+        # Rebase the journal on the restored queue
+        self.journal.snapshot(guild_id, self.queue.get_queue(guild_id), None)
+        logger.info("Restored %s queued track(s) in guild %s", len(tracks), guild_id)
+        voice = guild.get_channel(state['voice_channel_id']) if state['voice_channel_id'] else None
+        if not state['now_playing'] or voice is None or not any(not m.bot for m in voice.members):
+            return  # nobody to play to: the queue starts with the next !play
+        if guild.voice_client is None:
+            await voice.connect(self_mute=True, self_deaf=True)
+        # Messages go where the track was requested, or where the last one played if that is gone
+        channel_id = tracks[0].channel_id
+        if not channel_id or guild.get_channel_or_thread(channel_id) is None:
+            channel_id = state['text_channel_id']
+        ctx = PlaybackContext(self.bot, guild, channel_id, tracks[0].author_id)
+        # Resumes share the background resolver's rate limit
+        await self.resolver.bucket.acquire()
+        await ctx.send(f"Resuming after a restart with {len(tracks)} track(s) in the queue.")
+        await self.play_next(ctx, start_at=state['offset'])
+
+    def _idle(self, guild_id, vc):
+        # Nothing playing, paused or starting up (play_next sets now_playing before it resolves)
+        return not vc.is_playing() and not vc.is_paused() and self.queue.get_now_playing(guild_id) is None
 
     @commands.command()
     async def play(self, ctx, *, query):
-        logger.info(f"!play called by {ctx.author} in guild {ctx.guild.id} with query: {query}")
+        logger.info("!play called by %s in guild %s with query: %s", ctx.author, ctx.guild.id, query,
+                    extra=sampled(ctx.guild.id))
         if ctx.author.voice is None:
             await ctx.send("You are not in a voice channel.")
-            logger.warning(f"User {ctx.author} tried to play without being in a voice channel.")
+            logger.warning("User %s tried to play without being in a voice channel.", ctx.author)
             return
         channel = ctx.author.voice.channel
         if ctx.voice_client is None:
@@ -64,190 +345,255 @@ class Music(commands.Cog):
         vc = ctx.voice_client
         loop = ctx.bot.loop
 
-        # Handle Spotify playlist links
-        spotify_playlist_regex = re.compile(r"open\.spotify\.com/playlist/([a-zA-Z0-9]+)")
-        playlist_match = spotify_playlist_regex.search(query)
-        if playlist_match:
-            playlist_id = playlist_match.group(1)
-            playlist = self.sp.playlist(playlist_id)
-            tracks = playlist['tracks']['items']
-            added = 0
-            # Play first track immediately
-            for idx, item in enumerate(tracks):
-                track = item['track']
-                if not track: continue
-                track_query = f"{track['name']} {track['artists'][0]['name']}"
-                if idx == 0:
-                    # Resolve and play first track
-                    ydl_opts = {
-                        'format': 'bestaudio/best',
-                        'quiet': True,
-                        'default_search': 'ytsearch',
-                        'noplaylist': False,
-                        'extract_flat': False,
-                        'socket_timeout': 30,
-                    }
-                    try:
-                        info = await extract_info_async(loop, track_query, ydl_opts)
-                        if 'entries' in info:
-                            info = info['entries'][0]
-                        url2 = info['url']
-                        title = info.get('title', 'Unknown Title')
-                        duration = info.get('duration', 0)
-                        if vc.is_playing() or not self.queue.is_empty():
-                            self.queue.add(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name)
-                            await ctx.send(f"Queued: {title}")
-                        else:
-                            self.queue.set_now_playing(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name)
-                            await self.play_next(ctx)
-                            await ctx.send(f"Now playing: {title}")
-                        added += 1
-                        logger.info(f"Added and played first track from Spotify playlist: {title} (requested by {ctx.author})")
-                    except Exception as e:
-                        logger.error(f"Failed to add first track from Spotify playlist: {track_query} - {e}")
+        # Handle Spotify playlist and album links: every track is queued at once as pending and
+        # resolved in the background (ahead of playback by the prefetcher)
+        spotify_collection_regex = re.compile(r"open\.spotify\.com/(playlist|album)/([a-zA-Z0-9]+)")
+        collection_match = spotify_collection_regex.search(query)
+        if collection_match:
+            kind, spotify_id = collection_match.groups()
+            try:
+                if kind == 'playlist':
+                    name, tracks = await self.spotify.playlist(spotify_id)
                 else:
-                    # Add as pending
-                    self.queue.add(ctx.guild.id, track_query, None, ctx, None, ctx.author.display_name, pending=True)
-                    added += 1
-            await ctx.send(f"Added Spotify playlist: {playlist['name']} with {added} tracks to the queue.")
-            # Start background resolver if not running
-            if ctx.guild.id not in self.resolver_tasks or self.resolver_tasks[ctx.guild.id].done():
-                self.resolver_tasks[ctx.guild.id] = asyncio.create_task(self.resolve_pending(ctx.guild.id, ctx))
+                    name, tracks = await self.spotify.album(spotify_id)
+            except Exception as e:
+                logger.error("Failed to load Spotify %s %s: %s", kind, spotify_id, e)
+                await ctx.send(f"Failed to load that Spotify {kind}.")
+                return
+            for track in tracks:
+                self.spotify.expect(track)
+            await ctx.send(f"Added Spotify {kind}: {name} with {len(tracks)} tracks to the queue.")
+            logger.info("Added %s tracks from Spotify %s %s (requested by %s)", len(tracks), kind, name, ctx.author)
+            await self.queue_collection(ctx, vc, [(self.spotify.query(t), None, t.duration, t.video_id) for t in tracks])
             return
 
         # Handle Spotify single track links
+        spotify_video_id = None
         spotify_regex = re.compile(r"open\.spotify\.com/track/([a-zA-Z0-9]+)")
         match = spotify_regex.search(query)
         if match:
-            track_id = match.group(1)
-            track = self.sp.track(track_id)
-            query = f"{track['name']} {track['artists'][0]['name']}"
-
-        # Detect YouTube playlist
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'default_search': 'ytsearch',
-            'noplaylist': False,
-            'extract_flat': False,
-            'socket_timeout': 30,
-        }
+            try:
+                spotify_track = await self.spotify.track(match.group(1))
+            except Exception as e:
+                logger.error("Failed to load Spotify track %s: %s", match.group(1), e)
+                await ctx.send("Failed to load that Spotify track.")
+                return
+            query = self.spotify.query(spotify_track)
+            spotify_video_id = spotify_track.video_id
+            self.spotify.expect(spotify_track)
 
         # --- NEW: Check if song is already in the queue ---
-        tracks = self.queue.get_queue(ctx.guild.id)
-        found = False
-        for idx, (url, title, ctx_obj, duration, requester, search_query) in enumerate(tracks):
-            match_title = (title and query.lower() in title.lower())
-            match_url = (url and query.lower() in url.lower())
-            match_search = (search_query and query.lower() in search_query.lower())
-            if match_title or match_url or match_search:
-                found = True
-                mins, secs = divmod(duration or 0, 60)
-                eta = sum(t[3] or 0 for t in tracks[:idx])
-                eta_m, eta_s = divmod(eta, 60)
-                display_title = title or search_query or url or "(resolving...)"
-                await ctx.send(
-                    f"'{display_title}' is already in the queue at position {idx+1}. ETA: {eta_m:02}:{eta_s:02} (Length: {mins:02}:{secs:02})"
-                )
-                logger.info(f"Play: {display_title} already in queue for {ctx.author} at position {idx+1} ETA {eta_m:02}:{eta_s:02}")
-                return
+        with metrics.QUEUE_OP_SECONDS.time(op='search'):
+            matches = self.queue.search(ctx.guild.id, query)
+        if matches:
+            idx = matches[0]
+            url, title, channel_id, duration, requester, search_query = self.queue.get_queue(ctx.guild.id)[idx]
+            mins, secs = divmod(duration or 0, 60)
+            eta = self.queue.eta(ctx.guild.id, idx)
+            eta_m, eta_s = divmod(eta, 60)
+            display_title = title or search_query or url or "(resolving...)"
+            await ctx.send(
+                f"'{display_title}' is already in the queue at position {idx+1}. ETA: {eta_m:02}:{eta_s:02} (Length: {mins:02}:{secs:02})"
+            )
+            logger.info("Play: %s already in queue for %s at position %s ETA %02d:%02d",
+                        display_title, ctx.author, idx + 1, eta_m, eta_s, extra=sampled(ctx.guild.id))
+            return
         # --- END NEW ---
 
         try:
-            info = await extract_info_async(loop, query, ydl_opts)
+            if is_single_track_query(query):
+                info = await resolve_track(loop, query, video_id=spotify_video_id)
+                if match:
+                    await self.spotify.resolved(query, info.get('id'))
+            else:
+                # Detect YouTube playlist (flat: a listing only, nothing resolved yet)
+                info = await extract_info_async(loop, query, YDL_FLAT_OPTS)
             if 'entries' in info:
                 # Playlist detected
-                entries = info['entries']
-                for entry in entries:
-                    url2 = entry['url']
-                    title = entry.get('title', 'Unknown Title')
-                    duration = entry.get('duration', 0)
-                    self.queue.add(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name)
-                    logger.info(f"Added track from YouTube playlist: {title} (requested by {ctx.author})")
+                entries = [entry for entry in info['entries'] if entry and (entry.get('url') or entry.get('webpage_url'))]
                 await ctx.send(f"Added playlist: {info.get('title', 'Playlist')} with {len(entries)} tracks to the queue.")
-                if not vc.is_playing() and not self.queue.is_empty():
-                    await self.play_next(ctx)
+                logger.info("Added %s tracks from playlist %s (requested by %s)",
+                            len(entries), info.get('title'), ctx.author)
+                await self.queue_collection(ctx, vc, [
+                    (entry.get('webpage_url') or entry['url'], entry.get('title'),
+                     int(entry['duration']) if entry.get('duration') else None, entry.get('id'))
+                    for entry in entries
+                ])
                 return
             else:
                 url2 = info['url']
                 title = info.get('title', 'Unknown Title')
                 duration = info.get('duration', 0)
+                video_id = info.get('id')
         except Exception as e:
-            logger.error(f"Failed to extract info for query '{query}': {e}")
+            logger.error("Failed to extract info for query '%s': %s", query, e)
             await ctx.send("Failed to process your request.")
             return
 
         # Add to queue or play immediately
-        if vc.is_playing() or not self.queue.is_empty():
-            self.queue.add(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name)
+        if not self._idle(ctx.guild.id, vc):
+            with metrics.QUEUE_OP_SECONDS.time(op='add'):
+                self.queue.add(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name, search_query=query, video_id=video_id)
+            self.prefetcher.schedule(ctx.guild.id)
             await ctx.send(f"Queued: {title}")
-            logger.info(f"Queued: {title} (requested by {ctx.author})")
+            logger.info("Queued: %s (requested by %s)", title, ctx.author, extra=sampled(ctx.guild.id))
         else:
-            self.queue.set_now_playing(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name)
+            with metrics.QUEUE_OP_SECONDS.time(op='add'):
+                self.queue.add(ctx.guild.id, url2, title, ctx, duration, ctx.author.display_name, search_query=query, video_id=video_id)
+            await self.play_next(ctx)
+            logger.info("Now playing: %s (requested by %s)", title, ctx.author, extra=sampled(ctx.guild.id))
+
+    async def queue_collection(self, ctx, vc, entries):
+        # Queue a playlist's tracks as pending in one go. If nothing is playing, the first one
+        # plays as soon as it resolves; the background resolver and the prefetcher take the rest.
+        with metrics.QUEUE_OP_SECONDS.time(op='add_many'):
+            tracks = self.queue.add_many(ctx.guild.id, entries, ctx, ctx.author.display_name)
+        if self._idle(ctx.guild.id, vc):
             await self.play_next(ctx)
-            logger.info(f"Now playing: {title} (requested by {ctx.author})")
+        self.resolve_pending(ctx.guild.id)
+        self.prefetcher.schedule(ctx.guild.id)
+        return tracks
 
-    async def play_next(self, ctx, retry_data=None):
+    async def play_next(self, ctx, retry_data=None, start_at=0):
+        # start_at: seconds into the track, when resuming one that was interrupted by a restart
+        # Playback chains on from here through after_playback; it holds IDs, not the command context
+        ctx = PlaybackContext.of(ctx)
         vc = ctx.voice_client
+        started = time.perf_counter()
         if retry_data:
-            url2, title, ctx_obj, duration, requester, search_query, retries = retry_data
+            url2, title, channel_id, duration, requester, search_query, retries = retry_data
+            local_path = None
+            video_id = None  # retries always get a private ffmpeg process
+            # An early stop usually means the stream URL died; retry with a fresh one
+            if search_query:
+                try:
+                    info = await resolve_track(ctx.bot.loop, search_query, refresh=True)
+                    url2 = info['url']
+                except Exception as e:
+                    logger.error("Failed to refresh '%s' for retry: %s", search_query, e)
         else:
-            next_track = self.queue.next(ctx.guild.id)
-            if not next_track:
-                await ctx.send("Queue ended.")
-                logger.info("Queue ended.")
-                # Start disconnect timer
-                if ctx.guild.id in self.disconnect_timers:
-                    self.disconnect_timers[ctx.guild.id].cancel()
-                self.disconnect_timers[ctx.guild.id] = asyncio.create_task(self.disconnect_after_timeout(ctx.guild.id))
-                return
-            url2, title, ctx_obj, duration, requester, search_query = next_track
+            while True:
+                with metrics.QUEUE_OP_SECONDS.time(op='next'):
+                    next_track = self.queue.next(ctx.guild.id)
+                if not next_track:
+                    self.track_ended.pop(ctx.guild.id, None)
+                    await ctx.send("Queue ended.")
+                    logger.info("Queue ended.")
+                    # Start disconnect timer
+                    self.timers.schedule(('disconnect', ctx.guild.id), IDLE_DISCONNECT_AFTER, self.disconnect_idle, ctx.guild.id)
+                    return
+                # A track in the audio cache plays from disk: no stream URL to resolve or probe
+                local_path = None
+                checked = bool(self.audio_cache and not start_at and next_track.video_id)
+                if checked:
+                    local_path = await self.audio_cache.lookup(next_track.video_id)
+                # Otherwise usually a no-op thanks to the look-ahead; resolves tracks playback caught
+                # up with and replaces URLs that are about to expire or failed their probe
+                if local_path or await self.prefetcher.ensure_fresh(ctx.guild.id, next_track, margin=60):
+                    break
+                metrics.PLAYBACK_SKIPS.inc(reason='unresolvable')
+                await ctx.send(f"Could not play '{next_track.title or next_track.search_query}', skipping.")
+            url2, title, channel_id, duration, requester, search_query = next_track
+            video_id = next_track.video_id
             retries = 0
+            if self.audio_cache and not start_at and not checked:
+                # A search resolved just now may still be in the cache
+                local_path = await self.audio_cache.lookup(video_id)
         # Cancel disconnect timer if a new song starts
-        if ctx.guild.id in self.disconnect_timers:
-            self.disconnect_timers[ctx.guild.id].cancel()
+        self.timers.cancel(('disconnect', ctx.guild.id))
+        self.timers.cancel(('evict', ctx.guild.id))
         def after_playback(error=None):
+            self.track_ended[ctx.guild.id] = time.perf_counter()
             elapsed = time.time() - self.song_start_times.get(ctx.guild.id, (0,))[0]
             if error:
-                logger.error(f"FFmpeg error: {error}")
+                logger.error("FFmpeg error: %s", error)
             if elapsed < 30 and retries < 2:
-                logger.warning(f"Song '{title or search_query}' stopped early after {elapsed:.2f}s, retrying ({retries+1}/2)...")
-                coro = self.play_next(ctx, retry_data=(url2, title, ctx_obj, duration, requester, search_query, retries+1))
+                metrics.PLAYBACK_RETRIES.inc()
+                logger.warning("Song '%s' stopped early after %.2fs, retrying (%s/2)...",
+                               title or search_query, elapsed, retries + 1)
+                coro = self.play_next(ctx, retry_data=(url2, title, channel_id, duration, requester, search_query, retries+1))
                 asyncio.run_coroutine_threadsafe(coro, ctx.bot.loop)
             else:
                 coro = self.play_next(ctx)
                 asyncio.run_coroutine_threadsafe(coro, ctx.bot.loop)
                 if elapsed < 30:
+                    metrics.PLAYBACK_SKIPS.inc(reason='stopped_early')
                     asyncio.run_coroutine_threadsafe(ctx.send(f"Failed to play '{title or search_query}' after 2 retries, skipping."), ctx.bot.loop)
-        self.song_start_times[ctx.guild.id] = (time.time(), retries, url2, title, ctx_obj, duration, requester, search_query)
-        self.last_text_channel[ctx.guild.id] = ctx.channel
+        self.song_start_times[ctx.guild.id] = (time.time() - start_at, retries, url2, title, channel_id, duration, requester, search_query)
+        self.last_text_channel[ctx.guild.id] = ctx.channel_id
+        if self.journal:
+            self.journal.playing(ctx.guild.id, vc.channel.id, ctx.channel_id, start_at)
         # --- Insert playback record ---
-        user_id = getattr(ctx.author, 'id', str(ctx.author))
-        guild_id = str(ctx.guild.id)
-        guild_name = str(ctx.guild.name)
-        db.insert_playback(user_id, title or search_query or url2, url2, duration, guild_id, guild_name)
+        if not start_at:  # a resumed track was already counted
+            user_id = getattr(ctx.author, 'id', str(ctx.author))
+            guild_id = str(ctx.guild.id)
+            guild_name = str(ctx.guild.name)
+            self.stats.record(user_id, title or search_query or url2, url2, duration, guild_id, guild_name)
         # --- End insert ---
-        vc.play(discord.FFmpegPCMAudio(url2), after=after_playback)
+        if start_at:
+            source = make_source(url2, before_options=f"{FFMPEG_BEFORE_OPTIONS} -ss {start_at:.1f}")
+        elif local_path:
+            source = await self.audio_cache.open(local_path)
+        else:
+            source = make_source(url2, key=video_id)
+        vc.play(source, after=after_playback)
+        metrics.PLAYBACK_START_SECONDS.observe(time.perf_counter() - started)
+        ended = self.track_ended.pop(ctx.guild.id, None)
+        if ended is not None:
+            metrics.TRACK_GAP_SECONDS.observe(time.perf_counter() - ended)
+        # Get the upcoming tracks ready now, and check them again just before this one ends
+        self.prefetcher.schedule(ctx.guild.id, recheck_after=(duration or 0) - 30)
         await ctx.send(f"Now playing: {title or search_query}")
-        logger.info(f"Now playing: {title or search_query} (requested by {requester})")
+        logger.info("Now playing: %s (requested by %s)", title or search_query, requester, extra=sampled(ctx.guild.id))
 
-    async def disconnect_after_timeout(self, guild_id):
-        await asyncio.sleep(300)  # 5 minutes
-        # Check if still not playing
+    async def disconnect_idle(self, guild_id):
+        # Runs IDLE_DISCONNECT_AFTER seconds after the queue ended, unless a song started since
         guild = self.bot.get_guild(guild_id)
         if guild and guild.voice_client and not guild.voice_client.is_playing():
-            channel = self.last_text_channel.get(guild_id)
+            channel_id = self.last_text_channel.get(guild_id)
+            channel = guild.get_channel_or_thread(channel_id) if channel_id else None
             await guild.voice_client.disconnect()
+            minutes = round(IDLE_DISCONNECT_AFTER / 60)
             if channel:
-                await channel.send("No songs played for 5 minutes. Disconnected from voice.")
-            logger.info(f"Disconnected from voice in guild {guild_id} after 5 minutes of inactivity.")
+                await channel.send(f"No songs played for {minutes} minutes. Disconnected from voice.")
+            logger.info("Disconnected from voice in guild %s after %s minutes of inactivity.", guild_id, minutes)
+        elif guild is None or guild.voice_client is None:
+            self.forget_guild(guild_id)
+
+    def forget_guild(self, guild_id):
+        # Drop the per-guild playback state of a guild that is no longer playing, so the cog's
+        # memory is bounded by the guilds actually using it. Nothing here is needed to start again.
+        guild = self.bot.get_guild(guild_id)
+        vc = guild.voice_client if guild else None
+        if vc is not None and (vc.is_playing() or vc.is_paused()):
+            return
+        self.timers.cancel(('disconnect', guild_id))
+        self.song_start_times.pop(guild_id, None)
+        self.last_text_channel.pop(guild_id, None)
+        self.track_ended.pop(guild_id, None)
+        self.prefetcher.cancel(guild_id)
+        self.queue.forget(guild_id)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        # The bot left voice (!stop, idle disconnect, kicked or moved out): forget the guild soon
+        if self.bot.user is not None and member.id == self.bot.user.id and before.channel and not after.channel:
+            self.timers.cancel(('disconnect', member.guild.id))
+            self.timers.schedule(('evict', member.guild.id), STATE_EVICT_AFTER, self.forget_guild, member.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.resolver.cancel(guild.id)
+        self.queue.clear(guild.id)
+        self.timers.cancel(('evict', guild.id))
+        self.forget_guild(guild.id)
 
     @commands.command(name="queue")
     async def queue_(self, ctx, page: int = 1):
         tracks = self.queue.get_queue(ctx.guild.id)
         if not tracks:
             await ctx.send("Queue is empty.")
-            logger.info(f"Queue checked by {ctx.author} - empty.")
+            logger.info("Queue checked by %s - empty.", ctx.author)
             return
         per_page = 10
         pages = (len(tracks) + per_page - 1) // per_page
@@ -259,7 +605,7 @@ class Music(commands.Cog):
         elapsed = 0
         if now_playing and now_playing[3]:
             elapsed = now_playing[3]
-        for i, (url, title, ctx_obj, duration, requester, search_query) in enumerate(tracks[start:end], start=start+1):
+        for i, (url, title, channel_id, duration, requester, search_query) in enumerate(tracks[start:end], start=start+1):
             if title is None or duration is None:
                 display_title = search_query or url or "(resolving...)"
                 display_time = "(resolving...)"
@@ -268,8 +614,7 @@ class Music(commands.Cog):
                 display_title = title
                 mins, secs = divmod(duration, 60)
                 display_time = f"{mins:02}:{secs:02}"
-                prev_tracks = tracks[:i-1]
-                est_seconds = sum(t[3] for t in prev_tracks if t[3])
+                est_seconds = self.queue.eta(ctx.guild.id, i-1)
                 est_time = f"{est_seconds//60:02}:{est_seconds%60:02}"
             embed.add_field(
                 name=f"{i}. {display_title}",
@@ -277,16 +622,16 @@ class Music(commands.Cog):
                 inline=False
             )
         await ctx.send(embed=embed)
-        logger.info(f"Queue page {page} sent to {ctx.author}.")
+        logger.info("Queue page %s sent to %s.", page, ctx.author, extra=sampled(ctx.guild.id))
 
     @commands.command()
     async def trackinfo(self, ctx, pos: int):
         tracks = self.queue.get_queue(ctx.guild.id)
         if pos < 1 or pos > len(tracks):
             await ctx.send("Invalid track number.")
-            logger.warning(f"Invalid trackinfo request by {ctx.author}: {pos}")
+            logger.warning("Invalid trackinfo request by %s: %s", ctx.author, pos)
             return
-        url, title, ctx_obj, duration, requester, search_query = tracks[pos-1]
+        url, title, channel_id, duration, requester, search_query = tracks[pos-1]
         mins, secs = divmod(duration, 60)
         embed = discord.Embed(title="Track Information", color=discord.Color.green())
         embed.add_field(name="Track", value=title, inline=False)
@@ -294,29 +639,31 @@ class Music(commands.Cog):
         embed.add_field(name="Position in queue", value=str(pos), inline=True)
         embed.add_field(name="Requested by", value=requester, inline=True)
         await ctx.send(embed=embed)
-        logger.info(f"Trackinfo for {title} sent to {ctx.author}.")
+        logger.info("Trackinfo for %s sent to %s.", title, ctx.author, extra=sampled(ctx.guild.id))
 
     @commands.command()
     async def pause(self, ctx):
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.pause()
             await ctx.send("Paused.")
-            logger.info(f"Playback paused by {ctx.author}.")
+            logger.info("Playback paused by %s.", ctx.author)
 
     @commands.command()
     async def resume(self, ctx):
         if ctx.voice_client and ctx.voice_client.is_paused():
             ctx.voice_client.resume()
             await ctx.send("Resumed.")
-            logger.info(f"Playback resumed by {ctx.author}.")
+            logger.info("Playback resumed by %s.", ctx.author)
 
     @commands.command()
     async def stop(self, ctx):
         if ctx.voice_client:
             await ctx.voice_client.disconnect()
+            self.resolver.cancel(ctx.guild.id)
+            self.prefetcher.cancel(ctx.guild.id)
             self.queue.clear(ctx.guild.id)
             await ctx.send("Stopped and left the channel.")
-            logger.info(f"Playback stopped and bot disconnected by {ctx.author}.")
+            logger.info("Playback stopped and bot disconnected by %s.", ctx.author)
 
     @commands.command()
     async def next(self, ctx):
@@ -324,7 +671,7 @@ class Music(commands.Cog):
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.stop()
             await ctx.send("Skipped to the next song.")
-            logger.info(f"Skipped to next by {ctx.author}.")
+            logger.info("Skipped to next by %s.", ctx.author)
         else:
             await ctx.send("Nothing is playing.")
 
@@ -334,12 +681,12 @@ class Music(commands.Cog):
         # Not implemented: true previous queue, but can replay current
         now_playing = self.queue.get_now_playing(ctx.guild.id)
         if now_playing and now_playing[0]:
-            url2, title, ctx_obj, duration, requester, search_query = now_playing
+            url2, title, channel_id, duration, requester, search_query = now_playing
             ctx.voice_client.stop()
             await asyncio.sleep(1)
-            ctx.voice_client.play(discord.FFmpegPCMAudio(url2), after=lambda e: self.bot.loop.create_task(self.play_next(ctx)))
+            ctx.voice_client.play(make_source(url2), after=lambda e: self.bot.loop.create_task(self.play_next(ctx)))
             await ctx.send(f"Replaying: {title}")
-            logger.info(f"Replaying current song by {ctx.author}.")
+            logger.info("Replaying current song by %s.", ctx.author)
         else:
             await ctx.send("No song to replay.")
 
@@ -348,92 +695,68 @@ class Music(commands.Cog):
         """Repeat the current song and clear the queue."""
         now_playing = self.queue.get_now_playing(ctx.guild.id)
         if now_playing and now_playing[0]:
-            url2, title, ctx_obj, duration, requester, search_query = now_playing
+            url2, title, channel_id, duration, requester, search_query = now_playing
+            self.resolver.cancel(ctx.guild.id)
+            self.prefetcher.cancel(ctx.guild.id)
             self.queue.clear(ctx.guild.id)
             ctx.voice_client.stop()
             await asyncio.sleep(1)
-            self.queue.set_now_playing(ctx.guild.id, url2, title, ctx, duration, requester)
-            ctx.voice_client.play(discord.FFmpegPCMAudio(url2), after=lambda e: self.bot.loop.create_task(self.play_next(ctx)))
+            self.queue.set_now_playing(ctx.guild.id, url2, title, ctx, duration, requester, search_query)
+            ctx.voice_client.play(make_source(url2), after=lambda e: self.bot.loop.create_task(self.play_next(ctx)))
             await ctx.send(f"Repeating: {title} and cleared the queue.")
-            logger.info(f"Repeat command used by {ctx.author}.")
+            logger.info("Repeat command used by %s.", ctx.author)
         else:
             await ctx.send("No song to repeat.")
 
     @commands.command()
     async def clearqueue(self, ctx):
         """Clear the queue and stop playback."""
+        self.resolver.cancel(ctx.guild.id)
+        self.prefetcher.cancel(ctx.guild.id)
         self.queue.clear(ctx.guild.id)
         if ctx.voice_client:
             ctx.voice_client.stop()
         await ctx.send("Queue cleared and playback stopped.")
-        logger.info(f"Queue cleared by {ctx.author}.")
+        logger.info("Queue cleared by %s.", ctx.author)
 
     @commands.command()
     async def requestinfo(self, ctx, *, query):
         """Tell the user the position and ETA of a song in the queue."""
-        tracks = self.queue.get_queue(ctx.guild.id)
-        found = False
-        total_time = 0
-        for idx, (url, title, ctx_obj, duration, requester, search_query) in enumerate(tracks):
-            match_title = (title and query.lower() in title.lower())
-            match_url = (url and query.lower() in url.lower())
-            match_search = (search_query and query.lower() in search_query.lower())
-            if match_title or match_url or match_search:
-                found = True
-                mins, secs = divmod(duration or 0, 60)
-                eta = sum(t[3] or 0 for t in tracks[:idx])
-                eta_m, eta_s = divmod(eta, 60)
-                display_title = title or search_query or url or "(resolving...)"
-                await ctx.send(f"'{display_title}' is at position {idx+1} in the queue. ETA: {eta_m:02}:{eta_s:02} (Length: {mins:02}:{secs:02})")
-                logger.info(f"Requestinfo: {display_title} for {ctx.author} at position {idx+1} ETA {eta_m:02}:{eta_s:02}")
-                break
-            total_time += duration or 0
-        if not found:
+        matches = self.queue.search(ctx.guild.id, query, fuzzy=True)
+        if not matches:
             await ctx.send("That song is not in the queue.")
-            logger.info(f"Requestinfo: {query} not found for {ctx.author}.")
+            logger.info("Requestinfo: %s not found for %s.", query, ctx.author, extra=sampled(ctx.guild.id))
+            return
+        idx = matches[0]
+        url, title, channel_id, duration, requester, search_query = self.queue.get_queue(ctx.guild.id)[idx]
+        mins, secs = divmod(duration or 0, 60)
+        eta = self.queue.eta(ctx.guild.id, idx)
+        eta_m, eta_s = divmod(eta, 60)
+        display_title = title or search_query or url or "(resolving...)"
+        await ctx.send(f"'{display_title}' is at position {idx+1} in the queue. ETA: {eta_m:02}:{eta_s:02} (Length: {mins:02}:{secs:02})")
+        logger.info("Requestinfo: %s for %s at position %s ETA %02d:%02d",
+                    display_title, ctx.author, idx + 1, eta_m, eta_s, extra=sampled(ctx.guild.id))
 
     @commands.command()
     async def shuffle(self, ctx):
         """Shuffle the queue for this guild."""
-        import random
         tracks = self.queue.get_queue(ctx.guild.id)
         if not tracks or len(tracks) < 2:
             await ctx.send("Not enough tracks in the queue to shuffle.")
             return
-        random.shuffle(tracks)
-        self.queue.queues[ctx.guild.id] = tracks
+        self.queue.shuffle(ctx.guild.id)
         await ctx.send("Queue shuffled!")
-        logger.info(f"Queue shuffled by {ctx.author} in guild {ctx.guild.id}.")
+        logger.info("Queue shuffled by %s in guild %s.", ctx.author, ctx.guild.id)
 
-    async def resolve_pending(self, guild_id, ctx):
-        loop = ctx.bot.loop
-        while True:
-            pending = self.queue.next_pending(guild_id)
-            if not pending:
-                break
-            idx, query, ctx_obj, requester = pending
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'quiet': True,
-                'default_search': 'ytsearch',
-                'noplaylist': False,
-                'extract_flat': False,
-                'socket_timeout': 30,
-            }
-            try:
-                info = await extract_info_async(loop, query, ydl_opts)
-                if 'entries' in info:
-                    info = info['entries'][0]
-                url2 = info['url']
-                title = info.get('title', 'Unknown Title')
-                duration = info.get('duration', 0)
-                self.queue.mark_resolved(guild_id, idx, url2, title, duration)
-                logger.info(f"Resolved pending track: {title} (requested by {requester})")
-            except Exception as e:
-                logger.error(f"Failed to resolve pending track: {query} - {e}")
-                # Optionally, remove or skip this entry
-                self.queue.mark_resolved(guild_id, idx, None, f"[Failed: {query}]", 0)
-            await asyncio.sleep(1)  # Avoid hammering YouTube
+    async def resolve_queued(self, query, video_id=None, refresh=False):
+        # Resolution of queued tracks (background resolver and prefetcher)
+        info = await resolve_track(asyncio.get_running_loop(), query, refresh=refresh, video_id=video_id)
+        await self.spotify.resolved(query, info.get('id'))
+        return info
+
+    def resolve_pending(self, guild_id):
+        # Pending tracks are resolved by the shared, rate-limited ResolverScheduler
+        self.resolver.wake(guild_id)
 
 async def setup(bot):
     await bot.add_cog(Music(bot)) 
\ No newline at end of file
@@ -1,50 +1,499 @@
+import heapq
+import random
+from collections import deque
+from itertools import islice
+from operator import attrgetter
+
+from .resolve_cache import youtube_video_id
+
+
+def origin_ids(ctx):
+    # (channel_id, author_id) of a command context; tracks keep these instead of the context,
+    # which would pin its message, author and channel in memory while the track is queued
+    if ctx is None:
+        return None, None
+    channel = getattr(ctx, 'channel', None)
+    author = getattr(ctx, 'author', None)
+    return getattr(channel, 'id', None), getattr(author, 'id', None)
+
+
+class Track:
+    # Compact queue record. Iterating/indexing yields the legacy 6-tuple
+    # (url, title, channel_id, duration, requester, search_query) so older call sites keep
+    # working; the third element used to be the command ctx.
+    __slots__ = ('url', 'title', 'channel_id', 'duration', 'requester', 'search_query', 'pending', 'seq',
+                 'checked_at', 'video_id', 'author_id')
+
+    def __init__(self, url, title, channel_id, duration, requester, search_query, pending=False, video_id=None,
+                 author_id=None):
+        self.url = url
+        self.title = title
+        self.channel_id = channel_id  # where it was requested; the guild is the queue's
+        self.author_id = author_id
+        self.duration = duration
+        self.requester = requester
+        self.search_query = search_query
+        self.pending = pending
+        self.seq = 0
+        self.checked_at = 0  # when the stream URL was last probed
+        self.video_id = video_id
+
+    def as_tuple(self):
+        return (self.url, self.title, self.channel_id, self.duration, self.requester, self.search_query)
+
+    def __iter__(self):
+        return iter(self.as_tuple())
+
+    def __getitem__(self, i):
+        return self.as_tuple()[i]
+
+    def __len__(self):
+        return 6
+
+    def __repr__(self):
+        return f"Track(title={self.title!r}, search_query={self.search_query!r}, pending={self.pending})"
+
+
+class DurationIndex:
+    # Fenwick tree of track durations keyed by sequence number, so the cumulative duration in
+    # front of any queue position (its ETA) is an O(log n) lookup. Slots start at `origin`;
+    # the owner rebuilds the tree when sequence numbers run past its capacity.
+    __slots__ = ('origin', 'size', 'tree')
+
+    def __init__(self, origin=0, durations=()):
+        self.origin = origin
+        self.size = max(16, 2 * len(durations))
+        tree = [0] * (self.size + 1)
+        tree[1:len(durations) + 1] = durations
+        for i in range(1, self.size + 1):
+            j = i + (i & -i)
+            if j <= self.size:
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def covers(self, seq):
+        return seq - self.origin < self.size
+
+    def add(self, seq, delta):
+        i = seq - self.origin + 1
+        tree = self.tree
+        while i <= self.size:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, seq):
+        # Sum of all slots strictly before `seq`
+        i = seq - self.origin
+        total = 0
+        tree = self.tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+
+def _normalize(text):
+    # YouTube page URLs become their video ID (case kept), so searching for a watch URL finds the
+    # track queued from it whatever its other parameters; signed stream URLs (googlevideo) lose
+    # their long query string. Everything else is matched case-insensitively.
+    if text.startswith(('http://', 'https://')):
+        video_id = youtube_video_id(text)
+        if video_id:
+            return video_id
+        base = text.split('?', 1)[0]
+        if 'googlevideo.com' in base:
+            return base.lower()
+    return text.lower()
+
+
+def _search_keys(track):
+    # Pre-normalized strings a query is matched against
+    keys = {_normalize(text) for text in (track.title, track.search_query, track.url) if text}
+    if track.video_id:
+        keys.add(track.video_id)
+    return tuple(keys)
+
+
+_by_seq = attrgetter('seq')
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    # Trigram inverted index over a guild's queued tracks. Substring queries intersect the
+    # posting sets of their trigrams and only verify the surviving candidates.
+    __slots__ = ('keys', 'grams')
+
+    FUZZY_THRESHOLD = 0.5
+
+    def __init__(self):
+        self.keys = {}  # Track: tuple of normalized keys
+        self.grams = {}  # trigram: set of Track
+
+    def add(self, track):
+        keys = _search_keys(track)
+        self.keys[track] = keys
+        grams = self.grams
+        for key in keys:
+            for gram in _trigrams(key):
+                posting = grams.get(gram)
+                if posting is None:
+                    grams[gram] = {track}
+                else:
+                    posting.add(track)
+
+    def remove(self, track):
+        keys = self.keys.pop(track, None)
+        if not keys:
+            return
+        grams = self.grams
+        for key in keys:
+            for gram in _trigrams(key):
+                posting = grams.get(gram)
+                if posting is not None:
+                    posting.discard(track)
+                    if not posting:
+                        del grams[gram]
+
+    def search(self, query, fuzzy=False):
+        # Returns substring hits in queue order; if there are none and fuzzy is set, tracks
+        # sharing enough trigrams with the query, most similar first.
+        query = _normalize(query)
+        query_grams = _trigrams(query)
+        if not query_grams:
+            # Too short for trigrams: check the pre-normalized keys directly
+            hits = [t for t, keys in self.keys.items() if any(query in k for k in keys)]
+            hits.sort(key=_by_seq)
+            return hits
+        postings = sorted((self.grams.get(g, ()) for g in query_grams), key=len)
+        hits = []
+        if postings[0]:
+            candidates = set(postings[0]).intersection(*postings[1:])
+            hits = [t for t in candidates if any(query in k for k in self.keys[t])]
+            hits.sort(key=_by_seq)
+        if hits or not fuzzy:
+            return hits
+        scores = {}
+        for posting in postings:
+            for track in posting:
+                scores[track] = scores.get(track, 0) + 1
+        needed = self.FUZZY_THRESHOLD * len(query_grams)
+        similar = [t for t, n in scores.items() if n >= needed]
+        similar.sort(key=scores.__getitem__, reverse=True)
+        return similar
+
+
+class GuildQueue:
+    # Per-guild queue. Tracks live in a deque; every track carries a sequence number so its
+    # position is `track.seq - base` without scanning. Pending tracks are tracked by seq in a
+    # set plus a min-heap, so the pending track closest to the head is found in O(log n).
+    # Durations are mirrored into a DurationIndex for O(log n) ETAs. The SearchIndex over
+    # titles/queries is only built on the guild's first search and kept up to date after that:
+    # most queued tracks are never searched for.
+    __slots__ = ('tracks', 'base', 'pending', 'pending_heap', 'durations', 'index')
+
+    def __init__(self):
+        self.tracks = deque()
+        self.base = 0
+        self.pending = set()
+        self.pending_heap = []
+        self.durations = DurationIndex()
+        self.index = None
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self.tracks))
+            return list(islice(self.tracks, start, stop, step))
+        return self.tracks[idx]
+
+    def append(self, track):
+        track.seq = self.base + len(self.tracks)
+        self.tracks.append(track)
+        if track.pending:
+            self.pending.add(track.seq)
+            heapq.heappush(self.pending_heap, track.seq)
+        if self.durations.covers(track.seq):
+            self.durations.add(track.seq, track.duration or 0)
+        else:
+            self._reindex()
+        if self.index is not None:
+            self.index.add(track)
+
+    def extend(self, tracks):
+        # Bulk append: one pass over the new tracks, at most one duration-index rebuild
+        start = self.base + len(self.tracks)
+        for seq, track in enumerate(tracks, start=start):
+            track.seq = seq
+        self.tracks.extend(tracks)
+        pending = [t.seq for t in tracks if t.pending]
+        self.pending.update(pending)
+        # New seqs exceed every seq already in the heap, so appending keeps the heap invariant
+        self.pending_heap.extend(pending)
+        if self.durations.covers(start + len(tracks) - 1):
+            for track in tracks:
+                self.durations.add(track.seq, track.duration or 0)
+        else:
+            self._reindex()
+        if self.index is not None:
+            for track in tracks:
+                self.index.add(track)
+
+    def _reindex(self):
+        # Compact the duration index so it starts at the current head; amortized O(1) per append.
+        self.durations = DurationIndex(self.base, [t.duration or 0 for t in self.tracks])
+
+    def popleft(self):
+        track = self.tracks.popleft()
+        self.base += 1
+        self.pending.discard(track.seq)
+        if self.index is not None:
+            self.index.remove(track)
+        return track
+
+    def position(self, track):
+        return track.seq - self.base
+
+    def contains(self, track):
+        idx = track.seq - self.base
+        return 0 <= idx < len(self.tracks) and self.tracks[idx] is track
+
+    def resolve(self, track, url, title, duration, video_id=None):
+        self.durations.add(track.seq, (duration or 0) - (track.duration or 0))
+        if self.index is not None:
+            self.index.remove(track)
+        track.url = url
+        track.title = title
+        track.duration = duration
+        track.video_id = video_id or track.video_id
+        track.pending = False
+        self.pending.discard(track.seq)
+        if self.index is not None:
+            self.index.add(track)
+
+    def search(self, query, fuzzy=False):
+        if not self.tracks:
+            return []
+        if self.index is None:
+            self.index = SearchIndex()
+            for track in self.tracks:
+                self.index.add(track)
+        return [t.seq - self.base for t in self.index.search(query, fuzzy)]
+
+    def eta(self, idx):
+        # Seconds of queued audio in front of position `idx`
+        return self.durations.prefix(self.base + idx) - self.durations.prefix(self.base)
+
+    def total_duration(self):
+        return self.eta(len(self.tracks))
+
+    def claim(self, track):
+        # Hand a pending track to a resolver; it stays unresolved but is no longer offered
+        self.pending.discard(track.seq)
+
+    def first_pending(self):
+        heap = self.pending_heap
+        while heap and heap[0] not in self.pending:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return self.tracks[heap[0] - self.base]
+
+    def shuffle(self):
+        tracks = list(self.tracks)
+        random.shuffle(tracks)
+        # Tracks claimed by a resolver are still pending but must not be offered again
+        unclaimed = [t for t in tracks if t.seq in self.pending]
+        for seq, track in enumerate(tracks, start=self.base):
+            track.seq = seq
+        self.tracks = deque(tracks)
+        self.pending = {t.seq for t in unclaimed}
+        self.pending_heap = sorted(self.pending)
+        self._reindex()
+
+
+_EMPTY = ()
+
+
 class MusicQueue:
     def __init__(self):
-        # Each entry: (url, title, ctx, duration, requester, search_query) where url/title/duration may be None for pending
-        self.queues = {}  # guild_id: list
-        self.now_playing = {}  # guild_id: (url, title, ctx, duration, requester, search_query)
+        # Each entry is a Track: (url, title, channel_id, duration, requester, search_query) where url/title/duration may be None for pending
+        self.queues = {}  # guild_id: GuildQueue
+        self.now_playing = {}  # guild_id: Track
+        self._total = 0  # tracks queued across all guilds
+        self.journal = None  # optional QueueJournal told about every change, for resuming after a restart
+        # Track: future of the resolution running for it (background resolver or prefetcher), which
+        # yields True once the track has a usable URL. Others wait on it instead of extracting again.
+        self.resolving = {}
 
-    def add(self, guild_id, url_or_query, title, ctx, duration, requester, pending=False):
-        if guild_id not in self.queues:
-            self.queues[guild_id] = []
+    def _guild(self, guild_id):
+        q = self.queues.get(guild_id)
+        if q is None:
+            q = self.queues[guild_id] = GuildQueue()
+        return q
+
+    def add(self, guild_id, url_or_query, title, ctx, duration, requester, pending=False, search_query=None,
+            video_id=None):
+        # search_query is what the track can be re-resolved from once its stream URL expires
+        channel_id, author_id = origin_ids(ctx)
         if pending:
-            self.queues[guild_id].append((None, None, ctx, None, requester, url_or_query))
+            track = Track(None, None, channel_id, None, requester, url_or_query, pending=True, video_id=video_id,
+                          author_id=author_id)
         else:
-            self.queues[guild_id].append((url_or_query, title, ctx, duration, requester, url_or_query))
+            track = Track(url_or_query, title, channel_id, duration, requester, search_query or url_or_query,
+                          video_id=video_id, author_id=author_id)
+        self._guild(guild_id).append(track)
+        self._total += 1
+        if self.journal:
+            self.journal.add(guild_id, track)
+        return track
+
+    def add_many(self, guild_id, entries, ctx, requester):
+        # Queue many pending tracks at once; entries are (search_query, title, duration, video_id),
+        # where all but search_query may be None. Returns the new tracks.
+        channel_id, author_id = origin_ids(ctx)
+        tracks = [Track(None, title, channel_id, duration, requester, query, pending=True, video_id=video_id,
+                        author_id=author_id)
+                  for query, title, duration, video_id in entries]
+        if not tracks:
+            return tracks
+        self._guild(guild_id).extend(tracks)
+        self._total += len(tracks)
+        if self.journal:
+            self.journal.extend(guild_id, tracks)
+        return tracks
+
+    def restore(self, guild_id, tracks):
+        # Rebuild a guild's queue from the journal (not journaled again)
+        self._guild(guild_id).extend(tracks)
+        self._total += len(tracks)
 
     def next(self, guild_id):
-        if guild_id in self.queues and self.queues[guild_id]:
-            next_track = self.queues[guild_id].pop(0)
+        q = self.queues.get(guild_id)
+        if q:
+            next_track = q.popleft()
+            self._total -= 1
             self.now_playing[guild_id] = next_track
+            if self.journal:
+                self.journal.pop(guild_id)
             return next_track
         else:
             self.now_playing[guild_id] = None
+            if self.journal:
+                self.journal.idle(guild_id)
             return None
 
-    def set_now_playing(self, guild_id, url, title, ctx, duration, requester, search_query=None):
-        self.now_playing[guild_id] = (url, title, ctx, duration, requester, search_query or url)
+    def set_now_playing(self, guild_id, url, title, ctx, duration, requester, search_query=None, video_id=None):
+        channel_id, author_id = origin_ids(ctx)
+        self.now_playing[guild_id] = Track(url, title, channel_id, duration, requester, search_query or url,
+                                           video_id=video_id, author_id=author_id)
+        if self.journal:
+            self.journal.now_playing(guild_id, self.now_playing[guild_id])
 
     def clear(self, guild_id):
-        self.queues[guild_id] = []
+        q = self.queues.pop(guild_id, None)
+        if q:
+            self._total -= len(q)
         self.now_playing[guild_id] = None
+        if self.journal:
+            self.journal.clear(guild_id)
+
+    def forget(self, guild_id):
+        # Drop the bookkeeping of a guild with nothing queued or playing
+        if self.queues.get(guild_id) or self.now_playing.get(guild_id) is not None:
+            return False
+        self.queues.pop(guild_id, None)
+        self.now_playing.pop(guild_id, None)
+        if self.journal:
+            self.journal.forget(guild_id)
+        return True
 
-    def is_empty(self):
-        return all(not q for q in self.queues.values())
+    def is_empty(self, guild_id=None):
+        if guild_id is None:
+            return self._total == 0
+        return not self.queues.get(guild_id)
 
     def get_queue(self, guild_id):
-        return self.queues.get(guild_id, [])
+        return self.queues.get(guild_id, _EMPTY)
 
     def get_now_playing(self, guild_id):
         return self.now_playing.get(guild_id)
 
+    def shuffle(self, guild_id):
+        q = self.queues.get(guild_id)
+        if q:
+            q.shuffle()
+            if self.journal:
+                self.journal.snapshot(guild_id, q, self.now_playing.get(guild_id))
+
     def mark_resolved(self, guild_id, idx, url, title, duration):
         q = self.queues[guild_id]
-        _, _, ctx, _, requester, search_query = q[idx]
-        q[idx] = (url, title, ctx, duration, requester, search_query)
+        q.resolve(q[idx], url, title, duration)
+        if self.journal:
+            self.journal.resolve(guild_id, q[idx])
+
+    def eta(self, guild_id, idx):
+        q = self.queues.get(guild_id)
+        return q.eta(idx) if q else 0
+
+    def search(self, guild_id, query, fuzzy=False):
+        # Positions of queued tracks whose title, URL or search query contains `query`
+        # (earliest first); with fuzzy=True, falls back to trigram-similar tracks.
+        q = self.queues.get(guild_id)
+        return q.search(query, fuzzy) if q else []
+
+    def resolve_track(self, guild_id, track, url, title, duration, video_id=None):
+        # Like mark_resolved, but addressed by track so it is safe after the queue has moved on
+        q = self.queues.get(guild_id)
+        if q is not None and q.contains(track):
+            q.resolve(track, url, title, duration, video_id)
+            if self.journal:
+                self.journal.resolve(guild_id, track)
+        else:
+            track.url = url
+            track.title = title
+            track.duration = duration
+            track.video_id = video_id or track.video_id
+            track.pending = False
+
+    def peek_pending(self, guild_id):
+        # (position, track) of the unclaimed pending track nearest the head, or None
+        q = self.queues.get(guild_id)
+        if not q:
+            return None
+        track = q.first_pending()
+        if track is None:
+            return None
+        return q.position(track), track
+
+    def claim(self, guild_id, track):
+        # Take a specific pending track off the background resolver's list
+        q = self.queues.get(guild_id)
+        if q is not None and q.contains(track):
+            q.claim(track)
+
+    def claim_pending(self, guild_id):
+        q = self.queues.get(guild_id)
+        track = q.first_pending() if q else None
+        if track is not None:
+            q.claim(track)
+        return track
 
     def next_pending(self, guild_id):
-        q = self.queues.get(guild_id, [])
-        for idx, (url, title, ctx, duration, requester, search_query) in enumerate(q):
-            if title is None:
-                return idx, search_query, ctx, requester
-        return None 
\ No newline at end of file
+        q = self.queues.get(guild_id)
+        if not q:
+            return None
+        track = q.first_pending()
+        if track is None:
+            return None
+        return q.position(track), track.search_query, track.channel_id, track.requester
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from .resolve_cache import stream_expiry
+from .timers import TimerHeap
+
+logger = logging.getLogger("musicbot")
+
+
+class Prefetcher:
+    """Keeps the stream URLs of the next few queued tracks playable before they are needed.
+
+    For each of the first `lookahead` tracks it resolves pending entries, re-resolves URLs that
+    expire within `refresh_margin` seconds, and probes the URL with a one-byte range request so
+    dead links are replaced ahead of time instead of failing in ffmpeg.
+    """
+
+    def __init__(self, queue, resolve, lookahead=2, refresh_margin=600, probe_interval=120, probe_timeout=5,
+                 timers=None):
+        self.queue = queue
+        self.resolve = resolve  # async (query, refresh, video_id) -> info dict
+        self.lookahead = lookahead
+        self.refresh_margin = refresh_margin
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.tasks = {}  # guild_id: asyncio.Task
+        self._own_timers = timers is None
+        self.timers = TimerHeap() if timers is None else timers  # rechecks shortly before a song ends
+        self.refreshed = 0
+        self.dead = 0
+        self._session = None
+
+    async def close(self):
+        if self._own_timers:
+            await self.timers.close()
+        else:
+            for key in [key for key in self.timers.timers if key[0] == 'prefetch']:
+                self.timers.cancel(key)
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def schedule(self, guild_id, recheck_after=None):
+        # recheck_after (seconds) restarts the guild's look-ahead: one pass now and another shortly
+        # before the current song ends. Without it, a pass is only started if none is running.
+        task = self.tasks.get(guild_id)
+        if task is not None and not task.done():
+            if recheck_after is None:
+                return
+            task.cancel()
+        self.tasks[guild_id] = asyncio.create_task(self._run(guild_id))
+        if recheck_after is not None:
+            if recheck_after > 0:
+                self.timers.start()
+                self.timers.schedule(('prefetch', guild_id), recheck_after, self.schedule, guild_id, 0)
+            else:
+                self.timers.cancel(('prefetch', guild_id))
+
+    def cancel(self, guild_id):
+        self.timers.cancel(('prefetch', guild_id))
+        task = self.tasks.pop(guild_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _run(self, guild_id):
+        try:
+            await self._pass(guild_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Prefetch failed in guild %s: %s", guild_id, e)
+        finally:
+            if self.tasks.get(guild_id) is asyncio.current_task():
+                del self.tasks[guild_id]
+
+    async def _pass(self, guild_id):
+        for track in self.queue.get_queue(guild_id)[:self.lookahead]:
+            await self.ensure_fresh(guild_id, track)
+
+    def needs_refresh(self, track, margin=None):
+        if not track.url:
+            return True
+        expires_at = stream_expiry(track.url)
+        margin = self.refresh_margin if margin is None else margin
+        return expires_at is not None and expires_at - time.time() < margin
+
+    async def ensure_fresh(self, guild_id, track, margin=None, probe=True):
+        # Returns True if the track has a stream URL that should play
+        if track.pending or self.needs_refresh(track, margin):
+            if not await self._refresh(guild_id, track):
+                return False
+        if not probe or time.time() - track.checked_at < self.probe_interval:
+            return True
+        if await self.probe(track.url):
+            track.checked_at = time.time()
+            return True
+        self.dead += 1
+        logger.warning("Stream URL for '%s' failed its probe, re-resolving", track.title or track.search_query)
+        if not await self._refresh(guild_id, track):
+            return False
+        track.checked_at = time.time() if await self.probe(track.url) else 0
+        return bool(track.checked_at)
+
+    async def _refresh(self, guild_id, track):
+        inflight = self.queue.resolving.get(track)
+        if inflight is not None:
+            # Already being resolved (by the background resolver, or for playback): use that result.
+            # asyncio.wait leaves it running if we are cancelled.
+            await asyncio.wait((inflight,))
+            if not inflight.cancelled():
+                return inflight.result()
+        done = asyncio.get_running_loop().create_future()
+        self.queue.resolving[track] = done
+        if track.pending:
+            self.queue.claim(guild_id, track)
+        try:
+            # Pending tracks may still find a cached stream; anything else is being replaced
+            info = await self.resolve(track.search_query, not track.pending, track.video_id)
+        except asyncio.CancelledError:
+            done.cancel()  # waiters resolve it themselves
+            raise
+        except Exception as e:
+            logger.error("Failed to refresh stream URL for '%s': %s", track.search_query, e)
+            done.set_result(False)
+            return False
+        finally:
+            if self.queue.resolving.get(track) is done:
+                del self.queue.resolving[track]
+        self.queue.resolve_track(guild_id, track, info['url'], info['title'], info['duration'], info.get('id'))
+        self.refreshed += 1
+        done.set_result(True)
+        return True
+
+    async def probe(self, url):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.probe_timeout))
+        try:
+            async with self._session.get(url, headers={'Range': 'bytes=0-0'}) as resp:
+                return resp.status in (200, 206)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
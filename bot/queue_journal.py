@@ -0,0 +1,267 @@
+import asyncio
+import atexit
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+
+import bot.database as db
+import bot.metrics as metrics
+from .music_queue import Track, origin_ids
+
+
+def track_record(track):
+    # What survives a restart: everything needed to re-resolve and attribute the track, with the
+    # (expiring) stream URL dropped
+    return {
+        'title': track.title,
+        'duration': track.duration,
+        'requester': track.requester,
+        'search_query': track.search_query,
+        'video_id': track.video_id,
+        'channel_id': track.channel_id,
+        'author_id': track.author_id,
+    }
+
+
+def restore_track(record):
+    # Restored tracks are pending: their stream URL is re-resolved (from the video ID) only when
+    # playback or the prefetch look-ahead gets to them
+    return Track(None, record['title'], record['channel_id'], record['duration'], record['requester'],
+                 record['search_query'], pending=True, video_id=record['video_id'], author_id=record['author_id'])
+
+
+class PlaybackContext:
+    # Stand-in for commands.Context with the bits play_next() uses, built from IDs: playback
+    # (chained from track to track, or resumed after a restart) keeps no command context alive.
+    # The channel and author are looked up when they are used.
+    __slots__ = ('bot', 'guild', 'channel_id', 'author_id')
+
+    def __init__(self, bot, guild, channel_id, author_id=None):
+        self.bot = bot
+        self.guild = guild
+        self.channel_id = channel_id
+        self.author_id = author_id
+
+    @classmethod
+    def of(cls, ctx):
+        if isinstance(ctx, cls):
+            return ctx
+        channel_id, author_id = origin_ids(ctx)
+        return cls(ctx.bot, ctx.guild, channel_id, author_id)
+
+    @property
+    def channel(self):
+        return self.guild.get_channel_or_thread(self.channel_id) if self.channel_id else None
+
+    @property
+    def author(self):
+        if not self.author_id:
+            return self.bot.user
+        return self.guild.get_member(self.author_id) or discord.Object(self.author_id)
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        channel = self.channel
+        if channel is not None:
+            return await channel.send(*args, **kwargs)
+
+
+def _apply(state, op, data):
+    if op == 'snapshot':
+        state.update(data)
+    elif op == 'add':
+        state['tracks'].append(data)
+    elif op == 'extend':
+        state['tracks'].extend(data)
+    elif op == 'pop':
+        state['now_playing'] = state['tracks'].pop(0) if state['tracks'] else None
+        state['base'] += 1
+        state['offset'] = 0
+    elif op == 'idle':
+        state['now_playing'] = None
+    elif op == 'now_playing':
+        state['now_playing'] = data
+        state['offset'] = 0
+    elif op == 'clear':
+        state.update(base=0, tracks=[], now_playing=None, offset=0)
+    elif op == 'resolve':
+        idx = data.pop('seq') - state['base']
+        if 0 <= idx < len(state['tracks']):
+            state['tracks'][idx].update(data)
+    elif op == 'playing':
+        state.update(data)
+    elif op == 'progress':
+        state['offset'] = data['offset']
+
+
+def _empty_state():
+    return {'base': 0, 'tracks': [], 'now_playing': None, 'offset': 0, 'voice_channel_id': None,
+            'text_channel_id': None}
+
+
+class QueueJournal:
+    """Append-only SQLite journal of every guild's queue, for resuming after a restart or crash.
+
+    Queue operations are recorded as small JSON entries and written behind, in batches, on a
+    worker thread (same scheme as StatsWriter). A guild's state is its latest snapshot plus the
+    entries after it; writing a snapshot deletes everything older, which keeps replay short.
+    """
+
+    def __init__(self, flush_interval=1.0, compact_after=200):
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.buffer = []
+        self.since_snapshot = {}  # guild_id: entries recorded since its last snapshot
+        self.playback = {}  # guild_id: voice/text channel IDs and offset, carried into snapshots
+        self.closed = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queue-journal')
+        self._task = None
+        atexit.register(self.flush_sync)
+
+    def record(self, guild_id, op, data=None):
+        if self.closed:
+            return
+        self.buffer.append((guild_id, op, json.dumps(data) if data is not None else None, time.time()))
+        self.since_snapshot[guild_id] = self.since_snapshot.get(guild_id, 0) + 1
+
+    # Queue operations, called by MusicQueue
+    def add(self, guild_id, track):
+        self.record(guild_id, 'add', track_record(track))
+
+    def extend(self, guild_id, tracks):
+        self.record(guild_id, 'extend', [track_record(t) for t in tracks])
+
+    def pop(self, guild_id):
+        self.playback.get(guild_id, {})['offset'] = 0
+        self.record(guild_id, 'pop')
+
+    def idle(self, guild_id):
+        self.record(guild_id, 'idle')
+
+    def now_playing(self, guild_id, track):
+        self.record(guild_id, 'now_playing', track_record(track))
+
+    def clear(self, guild_id):
+        self.playback.pop(guild_id, None)
+        self.record(guild_id, 'clear')
+
+    def forget(self, guild_id):
+        # Nothing queued or playing any more: a final 'clear' deletes the guild's rows
+        self.clear(guild_id)
+        self.since_snapshot.pop(guild_id, None)
+
+    def resolve(self, guild_id, track):
+        self.record(guild_id, 'resolve', {'seq': track.seq, 'title': track.title, 'duration': track.duration,
+                                          'video_id': track.video_id})
+
+    def snapshot(self, guild_id, queue, now_playing):
+        data = _empty_state()
+        data.update(self.playback.get(guild_id, {}))
+        data['base'] = getattr(queue, 'base', 0)
+        data['tracks'] = [track_record(t) for t in queue]
+        data['now_playing'] = track_record(now_playing) if now_playing else None
+        self.record(guild_id, 'snapshot', data)
+        self.since_snapshot[guild_id] = 0
+
+    # Playback position, called by the Music cog
+    def playing(self, guild_id, voice_channel_id, text_channel_id, offset=0):
+        data = {'voice_channel_id': voice_channel_id, 'text_channel_id': text_channel_id, 'offset': offset}
+        self.playback[guild_id] = dict(data)
+        self.record(guild_id, 'playing', data)
+
+    def progress(self, guild_id, offset):
+        self.playback.setdefault(guild_id, {})['offset'] = offset
+        self.record(guild_id, 'progress', {'offset': offset})
+
+    def needs_compaction(self, guild_id):
+        return self.since_snapshot.get(guild_id, 0) >= self.compact_after
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Stop recording first: shutting down stops the voice clients, which would otherwise
+        # journal their queues advancing
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.flush_sync)
+        self._executor.shutdown(wait=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.buffer:
+                rows, self.buffer = self.buffer, []
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._write, rows)
+
+    def _write(self, rows):
+        with self._lock, metrics.DB_WRITE_SECONDS.time(table='queue_journal'):
+            try:
+                if self._conn is None:
+                    self._conn = db.get_db(check_same_thread=False)
+                    self._conn.execute('PRAGMA journal_mode=WAL')
+                    self._conn.execute('PRAGMA synchronous=NORMAL')
+                with self._conn:
+                    for guild_id, op, data, created_at in rows:
+                        if op == 'clear':
+                            # An empty queue needs no rows at all: replaying nothing gives the same state,
+                            # and the guild drops out of saved_guilds()
+                            self._conn.execute('''DELETE FROM queue_journal WHERE guild_id = ?''', (guild_id,))
+                            continue
+                        cur = self._conn.execute('''INSERT INTO queue_journal (guild_id, op, data, created_at) VALUES (?, ?, ?, ?)''',
+                                                 (guild_id, op, data, created_at))
+                        if op == 'snapshot':
+                            # Compaction: the snapshot supersedes all earlier entries
+                            self._conn.execute('''DELETE FROM queue_journal WHERE guild_id = ? AND id < ?''',
+                                               (guild_id, cur.lastrowid))
+                metrics.DB_ROWS_WRITTEN.inc(len(rows), table='queue_journal')
+            except Exception as e:
+                print(f"DB QueueJournal write error ({len(rows)} entries): {e}")
+
+    def flush_sync(self):
+        rows, self.buffer = self.buffer, []
+        if rows:
+            self._write(rows)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # Reading back, on startup (blocking; run in an executor)
+    def saved_guilds(self):
+        try:
+            conn = db.get_db()
+            rows = conn.execute('''SELECT DISTINCT guild_id FROM queue_journal''').fetchall()
+            conn.close()
+            return [row[0] for row in rows]
+        except Exception as e:
+            print(f"DB QueueJournal saved_guilds error: {e}")
+            return []
+
+    def load(self, guild_id):
+        # Replays the guild's entries; None if there is nothing to resume
+        try:
+            conn = db.get_db()
+            rows = conn.execute('''SELECT op, data FROM queue_journal WHERE guild_id = ? ORDER BY id''', (guild_id,)).fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"DB QueueJournal load error: {e}")
+            return None
+        state = _empty_state()
+        for op, data in rows:
+            _apply(state, op, json.loads(data) if data else None)
+        if not state['tracks'] and not state['now_playing']:
+            return None
+        return state
@@ -0,0 +1,96 @@
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+_YOUTUBE_ID_RE = re.compile(r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/)|youtu\.be/)([A-Za-z0-9_-]{11})")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    return _WHITESPACE_RE.sub(" ", query.strip()).lower()
+
+
+def youtube_video_id(query):
+    match = _YOUTUBE_ID_RE.search(query)
+    return match.group(1) if match else None
+
+
+def stream_expiry(url):
+    # Signed googlevideo URLs carry their expiry as a unix timestamp in `expire=`
+    try:
+        value = parse_qs(urlparse(url).query).get('expire')
+        if not value:
+            match = re.search(r"/expire/(\d+)", url)
+            return int(match.group(1)) if match else None
+        return int(value[0])
+    except (TypeError, ValueError):
+        return None
+
+
+class ResolutionCache:
+    """LRU + TTL cache of resolved yt-dlp results.
+
+    Stream entries are keyed by video ID and expire with their signed URL. Search entries map a
+    normalized query to a video ID; they don't expire, since only the stream URL goes stale.
+    """
+
+    def __init__(self, max_entries=2048, default_ttl=3600, expiry_margin=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+        self.streams = OrderedDict()  # video_id: (expires_at, info)
+        self.searches = OrderedDict()  # normalized query: video_id
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self, entries):
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_stream(self, video_id):
+        entry = self.streams.get(video_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, info = entry
+        if expires_at <= time.time():
+            del self.streams[video_id]
+            self.misses += 1
+            return None
+        self.streams.move_to_end(video_id)
+        self.hits += 1
+        return info
+
+    def put_stream(self, video_id, info):
+        expires_at = stream_expiry(info.get('url') or '')
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl
+        expires_at -= self.expiry_margin
+        if expires_at <= time.time():
+            return None
+        self.streams[video_id] = (expires_at, info)
+        self.streams.move_to_end(video_id)
+        self._evict(self.streams)
+        return expires_at
+
+    def get_video_id(self, query):
+        video_id = self.searches.get(query)
+        if video_id is not None:
+            self.searches.move_to_end(query)
+        return video_id
+
+    def put_video_id(self, query, video_id):
+        self.searches[query] = video_id
+        self.searches.move_to_end(query)
+        self._evict(self.searches)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'streams': len(self.streams),
+            'searches': len(self.searches),
+        }
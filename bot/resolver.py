@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+
+from .logs import sampled
+
+logger = logging.getLogger("musicbot")
+
+
+class TokenBucket:
+    # rate tokens per second, up to burst at once; a rate of 0 means no limit
+    def __init__(self, rate, burst):
+        if rate < 0:
+            raise ValueError(f"Token bucket rate must be >= 0, got {rate}")
+        if burst < 1:
+            raise ValueError(f"Token bucket burst must be >= 1, got {burst}")
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResolverScheduler:
+    """Background resolution of pending (e.g. Spotify playlist) tracks for every guild.
+
+    A single dispatcher hands out work with at most `concurrency` resolutions in flight and a
+    token-bucket limit of `rate` resolutions per second shared by all guilds. The next job is
+    always the pending track nearest to the head of its guild's queue.
+    """
+
+    def __init__(self, queue, resolve, concurrency=4, rate=2.0, burst=4):
+        self.queue = queue
+        self.resolve = resolve  # async (query, video_id) -> info dict; video_id may be None
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.active = set()  # guild_ids that may have pending tracks
+        self.jobs = {}  # guild_id: set of in-flight asyncio.Task
+        self.resolved = 0
+        self.failed = 0
+        self._slots = None
+        self._wakeup = None
+        self._dispatcher = None
+
+    def start(self):
+        if self._dispatcher is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for guild_id in list(self.jobs):
+            self.cancel(guild_id)
+
+    def wake(self, guild_id):
+        self.start()
+        self.active.add(guild_id)
+        self._wakeup.set()
+
+    def cancel(self, guild_id):
+        # Called on !stop/!clearqueue: forget the guild and drop its in-flight resolutions
+        self.active.discard(guild_id)
+        for task in self.jobs.pop(guild_id, ()):
+            task.cancel()
+
+    def _pick(self):
+        # Guild whose next pending track sits closest to the head of its queue
+        best = None
+        for guild_id in list(self.active):
+            pending = self.queue.peek_pending(guild_id)
+            if pending is None:
+                self.active.discard(guild_id)
+            elif best is None or pending[0] < best[1]:
+                best = (guild_id, pending[0])
+        return best[0] if best else None
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await self._slots.acquire()
+            if self._pick() is None:
+                self._slots.release()
+                self._wakeup.clear()
+                continue
+            await self.bucket.acquire()
+            # Pick again: priorities may have changed while waiting for a token
+            guild_id = self._pick()
+            track = self.queue.claim_pending(guild_id) if guild_id is not None else None
+            if track is None:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._resolve(guild_id, track))
+            self.jobs.setdefault(guild_id, set()).add(task)
+            self.queue.resolving[track] = task  # the prefetcher and play_next wait on it
+            # Bookkeeping lives in a done-callback so it also runs for jobs cancelled before starting
+            task.add_done_callback(lambda t, guild_id=guild_id, track=track: self._job_done(guild_id, track, t))
+
+    def _job_done(self, guild_id, track, task):
+        self._slots.release()
+        if self.queue.resolving.get(track) is task:
+            del self.queue.resolving[track]
+        jobs = self.jobs.get(guild_id)
+        if jobs is not None:
+            jobs.discard(task)
+            if not jobs:
+                del self.jobs[guild_id]
+
+    async def _resolve(self, guild_id, track):
+        query = track.search_query
+        try:
+            info = await self.resolve(query, track.video_id)
+            self.queue.resolve_track(guild_id, track, info['url'], info['title'], info['duration'], info.get('id'))
+            self.resolved += 1
+            logger.info("Resolved pending track: %s (requested by %s)", info['title'], track.requester,
+                        extra=sampled(guild_id))
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error("Failed to resolve pending track: %s - %s", query, e)
+            self.queue.resolve_track(guild_id, track, None, f"[Failed: {query}]", 0)
+            return False
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import bot.database as db
+
+logger = logging.getLogger("musicbot")
+
+
+def parse_shard_ids(spec):
+    # "0-3,6" -> [0, 1, 2, 3, 6]; empty/None means every shard
+    if not spec:
+        return None
+    ids = []
+    for part in spec.split(','):
+        start, _, end = part.strip().partition('-')
+        ids.extend(range(int(start), int(end or start) + 1))
+    return ids
+
+
+def shard_ranges(shard_count, processes):
+    # Split shards 0..shard_count-1 into `processes` contiguous, nearly equal ranges
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            ranges.append(range(start, end))
+        start = end
+    return ranges
+
+
+def owns_guild(bot, guild_id):
+    # Whether this process runs the shard Discord routes the guild to
+    shard_count = getattr(bot, 'shard_count', None)
+    if not shard_count:
+        return True
+    shard_ids = getattr(bot, 'shard_ids', None)
+    return shard_ids is None or (guild_id >> 22) % shard_count in shard_ids
+
+
+class ShardHeartbeat:
+    """Periodically upserts one shard_heartbeats row per shard this process runs.
+
+    The dashboard reads the table to show every shard across all processes; a shard whose row
+    stops being refreshed is reported as down.
+    """
+
+    def __init__(self, bot, interval=15):
+        self.bot = bot
+        self.interval = interval
+        self.host = socket.gethostname()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def rows(self):
+        bot = self.bot
+        now = time.time()
+        shard_count = bot.shard_count or 1
+        shards = getattr(bot, 'shards', None)
+        if shards:
+            latencies = {shard_id: shard.latency for shard_id, shard in shards.items()}
+        else:
+            latencies = {bot.shard_id or 0: bot.latency}
+        guilds = dict.fromkeys(latencies, 0)
+        voice = dict.fromkeys(latencies, 0)
+        for guild in bot.guilds:
+            shard_id = guild.shard_id or 0
+            guilds[shard_id] = guilds.get(shard_id, 0) + 1
+            if guild.voice_client is not None:
+                voice[shard_id] = voice.get(shard_id, 0) + 1
+        return [(shard_id, shard_count, os.getpid(), self.host, guilds.get(shard_id, 0), voice.get(shard_id, 0),
+                 round(latency * 1000, 1) if latency == latency and latency != float('inf') else None, now)
+                for shard_id, latency in latencies.items()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, db.record_shard_heartbeats, self.rows())
+            except Exception as e:
+                logger.error("Shard heartbeat failed: %s", e)
+            await asyncio.sleep(self.interval)
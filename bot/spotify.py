@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import spotipy
+
+import bot.async_db as async_db
+import bot.database as db
+from .resolve_cache import normalize_query
+
+logger = logging.getLogger("musicbot")
+
+SpotifyTrack = namedtuple('SpotifyTrack', 'id name artist duration isrc video_id')
+
+TRACK_FIELDS = "id,name,duration_ms,artists(name),external_ids(isrc)"
+
+
+def _track(item):
+    artists = item.get('artists') or ()
+    return SpotifyTrack(
+        item.get('id'),
+        item['name'],
+        artists[0]['name'] if artists else None,
+        (item.get('duration_ms') or 0) // 1000,
+        (item.get('external_ids') or {}).get('isrc'),
+        None,
+    )
+
+
+class SpotifyIngest:
+    """Async loading of Spotify playlists, albums and tracks.
+
+    spotipy is blocking, so calls run on a small thread pool (one client per thread). After the
+    first page reveals the total, the remaining pages are fetched concurrently. Track metadata is
+    cached in SQLite together with the YouTube video each recording resolved to, matched by ISRC,
+    so tracks seen before skip the YouTube search.
+    """
+
+    def __init__(self, auth_manager, workers=4, max_awaiting=10000):
+        self.auth_manager = auth_manager
+        self.max_awaiting = max_awaiting
+        self.awaiting = OrderedDict()  # normalized search query: (track id, isrc) until it resolves
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='spotify')
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, method, *args, **kwargs):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = spotipy.Spotify(auth_manager=self.auth_manager)
+        return getattr(client, method)(*args, **kwargs)
+
+    async def _run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._call, method, *args, **kwargs))
+
+    async def _pages(self, first, method, collection_id, **kwargs):
+        # All items of a paged collection, given its first page
+        items = list(first['items'])
+        limit = first['limit'] or len(items) or 1
+        rest = await asyncio.gather(*(self._run(method, collection_id, limit=limit, offset=offset, **kwargs)
+                                      for offset in range(len(items), first['total'], limit)))
+        for page in rest:
+            items.extend(page['items'])
+        return items
+
+    async def playlist(self, playlist_id):
+        first = await self._run('playlist', playlist_id, fields=f"name,tracks(total,limit,items(track({TRACK_FIELDS})))")
+        items = await self._pages(first['tracks'], 'playlist_items', playlist_id, fields=f"items(track({TRACK_FIELDS}))")
+        # Removed/unavailable entries come back without a track
+        tracks = [_track(item['track']) for item in items if item.get('track') and item['track'].get('name')]
+        return first['name'], await self._known(tracks)
+
+    async def album(self, album_id):
+        first = await self._run('album', album_id)
+        items = await self._pages(first['tracks'], 'album_tracks', album_id)
+        tracks = [_track(item) for item in items if item.get('name')]
+        return first['name'], await self._known(tracks)
+
+    async def track(self, track_id):
+        row = await async_db.spotify_track(track_id)
+        if row is not None:
+            return SpotifyTrack(*row)
+        return (await self._known([_track(await self._run('track', track_id))]))[0]
+
+    async def _known(self, tracks):
+        # Attach video IDs already known for these recordings and cache the metadata
+        found = await async_db.isrc_video_ids({t.isrc for t in tracks if t.isrc})
+        if found:
+            tracks = [t._replace(video_id=found.get(t.isrc)) for t in tracks]
+        rows = [(t.id, t.name, t.artist, t.duration, t.isrc) for t in tracks if t.id]
+        if rows:
+            await asyncio.get_running_loop().run_in_executor(None, db.cache_spotify_tracks, rows)
+        return tracks
+
+    def query(self, track):
+        # YouTube search text for a track
+        return f"{track.name} {track.artist}" if track.artist else track.name
+
+    def expect(self, track):
+        # Remember the track until its search resolves, to record the video it matched
+        if track.video_id is None and (track.id or track.isrc):
+            self.awaiting[normalize_query(self.query(track))] = (track.id, track.isrc)
+            while len(self.awaiting) > self.max_awaiting:
+                self.awaiting.popitem(last=False)
+
+    async def resolved(self, query, video_id):
+        ids = self.awaiting.pop(normalize_query(query), None)
+        if ids is not None and video_id:
+            await asyncio.get_running_loop().run_in_executor(None, db.set_spotify_video_id, ids[0], ids[1], video_id)
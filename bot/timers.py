@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("musicbot")
+
+
+class TimerHeap:
+    """Keyed deadlines for every guild, run by one task.
+
+    Replaces a sleeping asyncio task per guild and purpose (idle disconnect, prefetch recheck,
+    state eviction) with one heap of (deadline, seq, key) entries. Scheduling a key again moves its
+    deadline and cancel() is a dict pop: superseded heap entries are skipped when they surface,
+    and the heap is rebuilt once they outnumber the live timers. Callbacks run on the event loop;
+    a callback that returns a coroutine is run as a task.
+    """
+
+    def __init__(self):
+        self.timers = {}  # key: (deadline, seq, callback, args)
+        self.fired = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = set()  # tasks started by coroutine callbacks
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+        self.timers.clear()
+        self._heap = []
+
+    def schedule(self, key, delay, callback, *args):
+        # Run callback(*args) in `delay` seconds, replacing any timer already set for `key`
+        deadline = time.monotonic() + max(0.0, delay)
+        seq = next(self._seq)
+        self.timers[key] = (deadline, seq, callback, args)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if len(self._heap) > 2 * len(self.timers) + 64:
+            self._compact()
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()  # new earliest deadline
+
+    def cancel(self, key):
+        return self.timers.pop(key, None) is not None
+
+    def _compact(self):
+        self._heap = [(deadline, seq, key) for key, (deadline, seq, _, _) in self.timers.items()]
+        heapq.heapify(self._heap)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            handle = None
+            if self._heap:
+                handle = loop.call_later(max(0.0, self._heap[0][0] - time.monotonic()), self._wakeup.set)
+            await self._wakeup.wait()
+            if handle is not None:
+                handle.cancel()
+            self._fire(time.monotonic())
+
+    def _fire(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            entry = self.timers.get(key)
+            if entry is None or entry[1] != seq:
+                continue  # cancelled or rescheduled
+            del self.timers[key]
+            self.fired += 1
+            _, _, callback, args = entry
+            try:
+                result = callback(*args)
+            except Exception as e:
+                logger.error("Timer %s failed: %s", key, e)
+                continue
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self._running.add(task)
+                task.add_done_callback(lambda t, key=key: self._task_done(key, t))
+
+    def _task_done(self, key, task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Timer %s failed: %s", key, task.exception())
@@ -1,19 +1,64 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-import sqlite3
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import base64
+import json
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+import os
+import time
 import bot.database as db
+import bot.async_db as async_db
+import bot.metrics as metrics
+from bot.events import EventBus
+from dashboard.cache import ResponseCache
+from dashboard.live import StatsTailer
 db.init_db()
 from fastapi.responses import JSONResponse
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    loop_lag.start()
+    yield
+    await loop_lag.close()
+    await stats_tailer.close()
+    async_db.read_pool.close()
+
+app = FastAPI(lifespan=lifespan)
+# Rendered pages and analytics are served from memory until the bot writes new playback records
+response_cache = ResponseCache(async_db.stats_version, ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "2")))
+# Live updates: one tailer polls the database and fans each change out to every /events stream
+event_bus = EventBus()
+stats_tailer = StatsTailer(event_bus, interval=float(os.getenv("DASHBOARD_LIVE_INTERVAL", "1")))
+
+# Prometheus metrics for this process (the bot serves its own on METRICS_PORT)
+loop_lag = metrics.LoopLagMonitor(metrics.LOOP_LAG_SECONDS)
+REQUEST_SECONDS = metrics.Histogram("dashboard_request_seconds", "Dashboard request latency", ("route", "status"))
+CACHE_LOOKUPS = metrics.Counter("dashboard_response_cache_lookups_total", "Response cache lookups", ("result",))
+CACHE_LOOKUPS.set_function(lambda: {('hit',): response_cache.hits, ('miss',): response_cache.misses})
+SSE_SUBSCRIBERS = metrics.Gauge("dashboard_sse_subscribers", "Open /events streams")
+SSE_SUBSCRIBERS.set_function(lambda: len(event_bus.subscribers))
+
+if metrics.ENABLED:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        # The route template, not the raw path, so IDs don't each become a label value
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=getattr(route, "path", "unmatched"), status=response.status_code)
+        return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render())
 
 @app.get("/", response_class=HTMLResponse)
-async def index():
-    conn = sqlite3.connect("../musicbot.db")
-    c = conn.cursor()
-    c.execute("SELECT * FROM stats ORDER BY played_at DESC LIMIT 10")
-    stats = c.fetchall()
-    conn.close()
+async def index(request: Request):
+    return await response_cache.respond(request, "index", render_index, "text/html")
+
+async def render_index():
+    stats = await async_db.recent_playbacks(10)
     html = "<h1>Recent Songs Played</h1><ul>"
     for stat in stats:
         html += f"<li>{stat[2]} by user {stat[1]} at {stat[3]}</li>"
@@ -21,22 +66,157 @@ async def index():
     return html
 
 @app.get("/analytics/songs", response_class=JSONResponse)
-async def top_songs():
-    data = db.get_song_play_counts(10)
-    return {"labels": [row[0] for row in data], "counts": [row[1] for row in data]}
+async def top_songs(request: Request):
+    async def build():
+        data = await async_db.song_play_counts(10)
+        return json.dumps({"labels": [row[0] for row in data], "counts": [row[1] for row in data]})
+    return await response_cache.respond(request, "songs", build, "application/json")
 
 @app.get("/analytics/servers", response_class=JSONResponse)
-async def top_servers():
-    data = db.get_guild_stats()
-    # Use guild_name for labels
-    return {"labels": [row[1] for row in data], "counts": [row[2] for row in data]}
+async def top_servers(request: Request):
+    async def build():
+        data = await async_db.guild_stats()
+        # Use guild_name for labels
+        return json.dumps({"labels": [row[1] for row in data], "counts": [row[2] for row in data]})
+    return await response_cache.respond(request, "servers", build, "application/json")
+
+@app.get("/analytics/users", response_class=JSONResponse)
+async def top_users(request: Request):
+    async def build():
+        data = await async_db.user_play_counts(10)
+        return json.dumps({"labels": [row[0] for row in data], "counts": [row[1] for row in data]})
+    return await response_cache.respond(request, "users", build, "application/json")
+
+@app.get("/analytics/hourly", response_class=JSONResponse)
+async def hourly_plays(request: Request, hours: int = 24):
+    async def build():
+        data = await async_db.hourly_play_counts(hours)
+        return json.dumps({"labels": [row[0] for row in data], "counts": [row[1] for row in data]})
+    # The window slides with the clock, so the current hour is part of the key
+    key = f"hourly:{hours}:{time.strftime('%Y-%m-%d %H', time.gmtime())}"
+    return await response_cache.respond(request, key, build, "application/json")
+
+# Playback history: newest first, keyset-paginated on (played_at, id).
+# format=json returns one page and a next_cursor; format=ndjson streams every row in the window,
+# page by page, so exports of any size run in constant memory.
+HISTORY_PAGE_MAX = 1000
+
+def _timestamp(value, name):
+    # ISO 8601 date or datetime (naive means UTC) -> the stats table's played_at format
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def _encode_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps([row[-1], row[0]]).encode()).decode()
+
+def _decode_cursor(cursor):
+    if cursor is None:
+        return None
+    try:
+        played_at, play_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(played_at), int(play_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def history(guild_id=None, user_id=None, since=None, until=None, cursor=None, limit=100, format="json"):
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    filters = {"guild_id": guild_id, "user_id": user_id,
+               "since": _timestamp(since, "since"), "until": _timestamp(until, "until")}
+    before = _decode_cursor(cursor)
+    if format == "json":
+        rows = await async_db.plays(**filters, before=before, limit=limit)
+        return {"plays": [dict(zip(db.PLAY_COLUMNS, row)) for row in rows],
+                "next_cursor": _encode_cursor(rows[-1]) if len(rows) == limit else None}
+
+    async def stream():
+        position = before
+        while True:
+            rows = await async_db.plays(**filters, before=position, limit=HISTORY_PAGE_MAX)
+            if not rows:
+                return
+            yield "".join(json.dumps(dict(zip(db.PLAY_COLUMNS, row))) + "\n" for row in rows)
+            if len(rows) < HISTORY_PAGE_MAX:
+                return
+            position = (rows[-1][-1], rows[-1][0])
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/plays")
+async def recent_plays(since: str = None, until: str = None, cursor: str = None,
+                       limit: int = Query(100, ge=1, le=HISTORY_PAGE_MAX), format: str = "json"):
+    return await history(since=since, until=until, cursor=cursor, limit=limit, format=format)
+
+@app.get("/plays/guild/{guild_id}")
+async def guild_plays(guild_id: str, since: str = None, until: str = None, cursor: str = None,
+                      limit: int = Query(100, ge=1, le=HISTORY_PAGE_MAX), format: str = "json"):
+    return await history(guild_id=guild_id, since=since, until=until, cursor=cursor, limit=limit, format=format)
+
+@app.get("/plays/user/{user_id}")
+async def user_plays(user_id: str, since: str = None, until: str = None, cursor: str = None,
+                     limit: int = Query(100, ge=1, le=HISTORY_PAGE_MAX), format: str = "json"):
+    return await history(user_id=user_id, since=since, until=until, cursor=cursor, limit=limit, format=format)
+
+# Shards are reported down once their heartbeat is this many seconds old
+SHARD_STALE_AFTER = float(os.getenv("SHARD_STALE_AFTER", "60"))
+
+@app.get("/shards", response_class=JSONResponse)
+async def shards():
+    # Every shard across all bot processes, from the heartbeats they write to the shared database
+    now = time.time()
+    rows = await async_db.shard_heartbeats()
+    data = [{"shard_id": shard_id, "shard_count": shard_count, "pid": pid, "host": host, "guilds": guilds,
+             "voice_clients": voice_clients, "latency_ms": latency_ms, "last_seen": round(now - updated_at, 1),
+             "alive": now - updated_at < SHARD_STALE_AFTER}
+            for shard_id, shard_count, pid, host, guilds, voice_clients, latency_ms, updated_at in rows]
+    alive = [shard for shard in data if shard["alive"]]
+    return {"shards": data, "totals": {"shards": len(data), "alive": len(alive),
+                                       "guilds": sum(shard["guilds"] for shard in alive),
+                                       "voice_clients": sum(shard["voice_clients"] for shard in alive)}}
+
+@app.get("/events")
+async def events():
+    # Server-Sent Events: new plays plus the updated totals of the songs and servers they touched
+    stats_tailer.start()
+    queue = event_bus.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:  # fell too far behind; the browser reconnects
+                    return
+                yield event
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# JSON for embedding in a <script> block
+def _js(value):
+    return json.dumps(value).replace("</", "<\\/")
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard():
+async def dashboard(request: Request):
+    return await response_cache.respond(request, "dashboard", render_dashboard, "text/html")
+
+async def render_dashboard():
     # Top songs
-    song_data = db.get_song_play_counts(10)
+    song_data = await async_db.song_play_counts(10)
     # Top servers
-    server_data = db.get_guild_stats()
+    server_data = await async_db.guild_stats()
     html = """
     <html>
     <head>
@@ -51,28 +231,52 @@ async def dashboard():
         <h2>Top Servers by Play Count</h2>
         <canvas id='serversChart' width='400' height='200'></canvas>
         <div id='noServersMsg'></div>
+        <h2>Live Plays</h2>
+        <ul id='livePlays'></ul>
         <script>
-        const songLabels = """ + str([row[0] for row in song_data]) + """;
-        const songCounts = """ + str([row[1] for row in song_data]) + """;
+        const songLabels = """ + _js([row[0] for row in song_data]) + """;
+        const songCounts = """ + _js([row[1] for row in song_data]) + """;
         // Use guild_name for labels
-        const serverLabels = """ + str([row[1] for row in server_data]) + """;
-        const serverCounts = """ + str([row[2] for row in server_data]) + """;
+        const serverLabels = """ + _js([row[1] for row in server_data]) + """;
+        const serverCounts = """ + _js([row[2] for row in server_data]) + """;
         if (songLabels.length === 0) {
             document.getElementById('noSongsMsg').innerText = 'No song data available yet.';
-        } else {
-            new Chart(document.getElementById('songsChart'), {
-                type: 'bar',
-                data: { labels: songLabels, datasets: [{ label: 'Play Count', data: songCounts }] },
-            });
         }
         if (serverLabels.length === 0) {
             document.getElementById('noServersMsg').innerText = 'No server data available yet.';
-        } else {
-            new Chart(document.getElementById('serversChart'), {
-                type: 'bar',
-                data: { labels: serverLabels, datasets: [{ label: 'Play Count', data: serverCounts }] },
-            });
         }
+        const songsChart = new Chart(document.getElementById('songsChart'), {
+            type: 'bar',
+            data: { labels: songLabels, datasets: [{ label: 'Play Count', data: songCounts }] },
+        });
+        const serversChart = new Chart(document.getElementById('serversChart'), {
+            type: 'bar',
+            data: { labels: serverLabels, datasets: [{ label: 'Play Count', data: serverCounts }] },
+        });
+        // Merge updated totals into a top-10 chart in place
+        function applyCounts(chart, pairs, msgId) {
+            if (pairs.length === 0) return;
+            const counts = new Map(chart.data.labels.map((label, i) => [label, chart.data.datasets[0].data[i]]));
+            for (const [label, count] of pairs) counts.set(label, count);
+            const top = [...counts.entries()].sort((a, b) => b[1] - a[1]).slice(0, 10);
+            chart.data.labels = top.map(entry => entry[0]);
+            chart.data.datasets[0].data = top.map(entry => entry[1]);
+            chart.update();
+            document.getElementById(msgId).innerText = '';
+        }
+        const source = new EventSource('/events');
+        source.addEventListener('stats', (e) => {
+            const delta = JSON.parse(e.data);
+            applyCounts(songsChart, delta.songs, 'noSongsMsg');
+            applyCounts(serversChart, delta.servers, 'noServersMsg');
+            const list = document.getElementById('livePlays');
+            for (const play of delta.plays) {
+                const item = document.createElement('li');
+                item.innerText = `${play.song} in ${play.guild_name} at ${play.played_at}`;
+                list.prepend(item);
+            }
+            while (list.children.length > 20) list.lastChild.remove();
+        });
         </script>
     </body>
     </html>
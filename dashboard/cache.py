@@ -0,0 +1,53 @@
+import hashlib
+import time
+
+from fastapi.responses import Response
+
+
+class ResponseCache:
+    """Rendered responses keyed by request, reused until the stats version changes.
+
+    The version (bumped by every stats write) is re-read at most once per `ttl` seconds, so within
+    that window a repeated request costs a dict lookup. Responses carry a content ETag and a
+    matching If-None-Match is answered with 304 Not Modified.
+    """
+
+    def __init__(self, version, ttl=2.0, max_entries=256):
+        self.version = version  # async () -> current stats version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}  # key: (version, body, etag, media_type)
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._checked_at = 0.0
+
+    async def current_version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self.ttl:
+            self._version = await self.version()
+            self._checked_at = now
+        return self._version
+
+    async def respond(self, request, key, build, media_type):
+        # build: async () -> response body (str or bytes), only awaited on a miss
+        version = await self.current_version()
+        entry = self.entries.get(key)
+        if entry is None or version is None or entry[0] != version:
+            self.misses += 1
+            body = await build()
+            if isinstance(body, str):
+                body = body.encode()
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            entry = (version, body, etag, media_type)
+            if version is not None:
+                if len(self.entries) >= self.max_entries and key not in self.entries:
+                    self.entries.clear()
+                self.entries[key] = entry
+        else:
+            self.hits += 1
+        _, body, etag, media_type = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=media_type, headers=headers)
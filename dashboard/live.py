@@ -0,0 +1,70 @@
+import asyncio
+import json
+import logging
+
+import bot.async_db as async_db
+
+logger = logging.getLogger("musicbot")
+
+
+class StatsTailer:
+    """Turns new rows in the stats table into events on an EventBus.
+
+    The bot writes from another process, so once per `interval` the tailer checks the stats
+    version and, if it moved, reads the new rows plus the updated rollup totals of the songs and
+    guilds they touch. Each tick costs at most those queries however many viewers are connected,
+    and the event is serialized once for all of them.
+    """
+
+    def __init__(self, bus, interval=1.0, batch=500):
+        self.bus = bus
+        self.interval = interval
+        self.batch = batch
+        self.last_id = None
+        self.version = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        self.last_id = await async_db.last_play_id()
+        self.version = await async_db.stats_version()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Stats tailer tick failed: %s", e)
+
+    async def tick(self):
+        if self.last_id is None:
+            self.last_id = await async_db.last_play_id()
+            return
+        version = await async_db.stats_version()
+        if version == self.version:
+            return
+        self.version = version
+        rows = await async_db.plays_since(self.last_id, self.batch)
+        if not rows:
+            return
+        self.last_id = rows[-1][0]
+        if len(rows) == self.batch:
+            self.version = None  # more waiting: read the next batch on the following tick
+        songs = await async_db.song_counts_for({row[2] for row in rows})
+        guilds = await async_db.guild_counts_for({row[3] for row in rows})
+        event = {
+            "plays": [{"user_id": row[1], "song": row[2], "guild_name": row[4], "played_at": row[5]} for row in rows],
+            "songs": [[song, count] for song, count in songs],
+            # Use guild_name for labels, like the servers chart
+            "servers": [[name, count] for _, name, count in guilds],
+        }
+        self.bus.publish(f"event: stats\ndata: {json.dumps(event)}\n\n")